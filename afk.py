@@ -0,0 +1,47 @@
+def merge_intervals(intervals):
+    """合并按开始时间排序的 (start, end) 区间，重叠或相接的区间合为一个
+
+    aw-watcher-afk 的心跳合并后相邻事件可能重叠，合并后得到互不重叠的活跃区间。
+    """
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def active_totals(window_events, active_intervals, lo, hi):
+    """计算窗口事件落在活跃区间内的时长，按 (app, title) 汇总
+
+    window_events 是按开始时间排序的 (start, end, app, title)，active_intervals 是 merge_intervals
+    的结果，时长截取到 [lo, hi) 内。两个序列各扫描一遍，复杂度 O(n + m)：活跃区间的指针只向前移动，
+    每个窗口事件只检查与它重叠的活跃区间。
+    事件数按开始时间计入 [lo, hi)；返回 (app, title, 活跃时长, 事件数) 列表。
+    """
+    totals = {}
+    j = 0
+    count = len(active_intervals)
+    for start, end, app, title in window_events:
+        s = max(start, lo)
+        e = min(end, hi)
+        # 跳过在本事件开始前就结束的活跃区间，后面的事件开始得更晚，也不会再用到它们
+        while j < count and active_intervals[j][1] <= s:
+            j += 1
+        active = 0.0
+        k = j
+        while e > s and k < count and active_intervals[k][0] < e:
+            active += min(e, active_intervals[k][1]) - max(s, active_intervals[k][0])
+            k += 1
+        counted = 1 if lo <= start < hi else 0
+        if not active and not counted:
+            continue
+        item = totals.get((app, title))
+        if item is None:
+            totals[(app, title)] = [active, counted]
+        else:
+            item[0] += active
+            item[1] += counted
+    return [(app, title, duration, counted) for (app, title), (duration, counted) in totals.items()]
@@ -0,0 +1,262 @@
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+
+from array import array
+from datetime import datetime, timezone
+
+from columnar import EventBatch, StringTable
+
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖，没有时逐行筛选
+    np = None
+
+DAY = 86400
+SEGMENT_MAGIC = b'AWS1'
+# 分段头：魔数、事件数、6 个压缩后的列长度（开始时间差分、时长、应用编码、标题编码、应用表、标题表）
+_HEADER = struct.Struct('<4sI6I')
+COMPRESS_LEVEL = 6
+
+
+def day_name(day_start):
+    """UTC 日期字符串，用作分段文件名"""
+    return datetime.fromtimestamp(day_start, timezone.utc).strftime('%Y-%m-%d')
+
+
+def _to_bytes(values):
+    # 文件中的数值列统一为小端序
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def encode_segment(batch):
+    """把按开始时间升序的 EventBatch 编码成一个压缩的列式分段
+
+    开始时间存相邻事件的差值，数值很小且重复多，压缩率比直接存 epoch 微秒高得多。
+    """
+    deltas = array('q', (b - a for a, b in zip(itertools.chain((0,), batch.timestamps), batch.timestamps)))
+    columns = [
+        _to_bytes(deltas),
+        _to_bytes(batch.durations),
+        _to_bytes(batch.app_codes),
+        _to_bytes(batch.title_codes),
+        json.dumps(batch.apps.strings, ensure_ascii=False).encode('utf-8'),
+        json.dumps(batch.titles.strings, ensure_ascii=False).encode('utf-8'),
+    ]
+    compressed = [zlib.compress(column, COMPRESS_LEVEL) for column in columns]
+    return _HEADER.pack(SEGMENT_MAGIC, len(batch), *map(len, compressed)) + b''.join(compressed)
+
+
+def decode_segment(buffer):
+    """从分段的字节（可以是 mmap 的切片）解码出 EventBatch，只解压这一个分段"""
+    magic, count, *lengths = _HEADER.unpack_from(buffer)
+    if magic != SEGMENT_MAGIC:
+        raise ValueError("不是有效的归档分段")
+    columns = []
+    offset = _HEADER.size
+    for length in lengths:
+        columns.append(zlib.decompress(buffer[offset:offset + length]))
+        offset += length
+
+    batch = EventBatch(StringTable(), StringTable())
+    batch.timestamps = array('q', itertools.accumulate(_from_bytes('q', columns[0])))
+    batch.durations = _from_bytes('d', columns[1])
+    batch.app_codes = _from_bytes('I', columns[2])
+    batch.title_codes = _from_bytes('I', columns[3])
+    for value in json.loads(columns[4]):
+        batch.apps.intern(value)
+    for value in json.loads(columns[5]):
+        batch.titles.intern(value)
+    if len(batch) != count:
+        raise ValueError("归档分段已损坏")
+    return batch
+
+
+def select_overlapping(batch, start_ts, end_ts, before=None, exclude=None):
+    """筛选与 [start_ts, end_ts] 有重叠的事件（可再限定开始时间早于 before、不在 exclude=[lo, hi) 内），共用字符串表"""
+    start_us = start_ts * 1000000
+    end_us = end_ts * 1000000
+    if np is not None:
+        starts = np.frombuffer(batch.timestamps, dtype=np.int64)
+        durations = np.frombuffer(batch.durations, dtype=np.float64)
+        mask = (starts + durations * 1000000 >= start_us) & (starts <= end_us)
+        if before is not None:
+            mask &= starts < before * 1000000
+        if exclude is not None:
+            mask &= (starts < exclude[0] * 1000000) | (starts >= exclude[1] * 1000000)
+        indexes = np.flatnonzero(mask).tolist()
+    else:
+        indexes = []
+        for i, (ts, duration) in enumerate(zip(batch.timestamps, batch.durations)):
+            if ts + duration * 1000000 < start_us or ts > end_us:
+                continue
+            if before is not None and ts >= before * 1000000:
+                continue
+            if exclude is not None and exclude[0] * 1000000 <= ts < exclude[1] * 1000000:
+                continue
+            indexes.append(i)
+    if len(indexes) == len(batch):
+        return batch
+
+    selected = EventBatch(batch.apps, batch.titles)
+    selected.timestamps = array('q', (batch.timestamps[i] for i in indexes))
+    selected.durations = array('d', (batch.durations[i] for i in indexes))
+    selected.app_codes = array('I', (batch.app_codes[i] for i in indexes))
+    selected.title_codes = array('I', (batch.title_codes[i] for i in indexes))
+    return selected
+
+
+class SegmentArchive:
+    """历史事件归档：已经结束的 UTC 日压缩成不可变的按天分段文件，读取时内存映射
+
+    每个文件是一天（文件名为 UTC 日期），包含这一天各 bucket 的一个分段（按开始时间归属到天）；
+    index.json 记录每个 (bucket, 天) 分段所在的文件、偏移、长度、事件数和最晚结束时间。
+    查询只打开和解压与时间范围有重叠的分段，解码为列式 EventBatch，不会把整段历史变成 Python 对象。
+    索引由负责同步的进程写入（先写临时文件再替换），其他进程发现索引文件变化后重新读取。
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._index = {}  # bucket -> {天的开始时间: (文件名, 偏移, 长度, 事件数, 最晚结束时间)}
+        self._index_mtime = None
+        self._maps = {}  # 文件名 -> mmap
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def _refresh_index_locked(self):
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._index_mtime:
+            return
+        with open(self.index_path, encoding='utf-8') as f:
+            raw = json.load(f)
+        self._index = {
+            bucket: {int(day): tuple(entry) for day, entry in days.items()}
+            for bucket, days in raw['segments'].items()
+        }
+        self._index_mtime = mtime
+
+    def _write_index_locked(self):
+        raw = {'version': 1, 'segments': {
+            bucket: {str(day): list(entry) for day, entry in sorted(days.items())}
+            for bucket, days in self._index.items()
+        }}
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(raw, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    def archived_days(self, bucket):
+        """已归档的天（开始时间）集合"""
+        with self._lock:
+            self._refresh_index_locked()
+            return set(self._index.get(bucket, {}))
+
+    def write_day(self, day_start, batches):
+        """把一天的 {bucket: EventBatch} 写成一个新的分段文件并更新索引，已经归档过的 bucket 跳过
+
+        同一天后来才出现的 bucket（例如新加的数据源回填）写到这一天的下一个文件，已有文件不会被修改。
+        """
+        with self._lock:
+            self._refresh_index_locked()
+            batches = {
+                bucket: batch for bucket, batch in batches.items()
+                if len(batch) and day_start not in self._index.get(bucket, {})
+            }
+            if not batches:
+                return 0
+
+            name = day_name(day_start)
+            generation = 0
+            while os.path.exists(os.path.join(self.directory, f"{name}.{generation}.seg")):
+                generation += 1
+            filename = f"{name}.{generation}.seg"
+            entries = {}
+            tmp_path = os.path.join(self.directory, filename + '.tmp')
+            with open(tmp_path, 'wb') as f:
+                for bucket, batch in sorted(batches.items()):
+                    segment = encode_segment(batch)
+                    last_end = max(ts / 1000000 + duration for ts, duration in zip(batch.timestamps, batch.durations))
+                    entries[bucket] = (filename, f.tell(), len(segment), len(batch), last_end)
+                    f.write(segment)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.directory, filename))
+
+            for bucket, entry in entries.items():
+                self._index.setdefault(bucket, {})[day_start] = entry
+            self._write_index_locked()
+            return sum(len(batch) for batch in batches.values())
+
+    def _map_locked(self, filename):
+        mapped = self._maps.get(filename)
+        if mapped is None:
+            with open(os.path.join(self.directory, filename), 'rb') as f:
+                mapped = self._maps[filename] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped
+
+    def iter_batches(self, bucket, start_ts, end_ts):
+        """按天升序生成与 [start_ts, end_ts] 有重叠的分段解码后的 EventBatch（未按时间范围筛选）"""
+        with self._lock:
+            self._refresh_index_locked()
+            days = self._index.get(bucket, {})
+            # 分段按开始时间归属到天，但跨过午夜的事件可能延伸到之后的天，所以用最晚结束时间判断
+            entries = [
+                days[day] for day in sorted(days)
+                if day <= end_ts and days[day][4] >= start_ts
+            ]
+        for filename, offset, length, _, _ in entries:
+            with self._lock:
+                mapped = self._map_locked(filename)
+            view = memoryview(mapped)[offset:offset + length]
+            try:
+                yield decode_segment(view)
+            finally:
+                view.release()
+
+    def query_batches(self, bucket, start_ts, end_ts, before=None, exclude=None):
+        """返回与 [start_ts, end_ts] 有重叠的归档事件，每天一个 EventBatch，筛选条件同 select_overlapping"""
+        batches = []
+        for batch in self.iter_batches(bucket, start_ts, end_ts):
+            batch = select_overlapping(batch, start_ts, end_ts, before, exclude)
+            if len(batch):
+                batches.append(batch)
+        return batches
+
+    def size(self):
+        """分段文件的总字节数"""
+        with self._lock:
+            self._refresh_index_locked()
+            filenames = {entry[0] for days in self._index.values() for entry in days.values()}
+        return sum(os.path.getsize(os.path.join(self.directory, filename)) for filename in filenames)
+
+    def close(self):
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
@@ -0,0 +1,226 @@
+import codecs
+import json
+import threading
+import time
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import PHASE_SECONDS, UPSTREAM_ERRORS, UPSTREAM_REQUESTS
+
+
+_END = object()
+
+
+class ActivityWatchUnavailable(Exception):
+    """ActivityWatch 服务不可用（连接失败、超时、服务端错误或熔断中），与“时间段内没有事件”区分开"""
+
+
+def iter_json_array(chunks):
+    """增量解析顶层为数组的 JSON 字节流，逐个产出数组元素，内存占用与数组长度无关"""
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    started = False
+    exhausted = False
+
+    while True:
+        # 跳过空白以及元素之间的逗号
+        while pos < len(buf) and (buf[pos].isspace() or (started and buf[pos] == ',')):
+            pos += 1
+
+        if pos < len(buf):
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError("响应不是JSON数组")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == ']':
+                return
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                end = None
+            # 顶层的数字在块边界处可能只读到一部分（例如 "1." 或 "1e"），后面跟着空白、逗号或 ] 才算读完，否则再读一块确认
+            if end is not None and (exhausted or (end < len(buf) and (buf[end].isspace() or buf[end] in ',]'))):
+                yield value
+                pos = end
+                continue
+
+        if exhausted:
+            raise ValueError("JSON数组不完整")
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            exhausted = True
+            buf = buf[pos:] + text_decoder.decode(b'', final=True)
+        else:
+            buf = buf[pos:] + text_decoder.decode(chunk)
+        pos = 0
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后在 reset_timeout 秒内直接拒绝请求，之后放行一次试探请求"""
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow_request(self):
+        """熔断打开时返回 False；冷却结束后只放行一个试探请求"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class ActivityWatchClient:
+    """共享的 ActivityWatch HTTP 客户端：连接池 + keep-alive、有限次退避重试和熔断"""
+
+    def __init__(self, base_url, timeout=(3.05, 10), retries=2, backoff_factor=0.5,
+                 pool_size=10, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=1,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, path, params=None, stream=False):
+        """发送 GET 请求并返回响应；服务不可用或熔断打开时抛出 ActivityWatchUnavailable"""
+        if not self.breaker.allow_request():
+            self._record_error('circuit_open')
+            raise ActivityWatchUnavailable("ActivityWatch服务不可用（熔断中，稍后自动重试）")
+
+        UPSTREAM_REQUESTS.inc(base_url=self.base_url)
+        try:
+            start = time.perf_counter()
+            resp = self.session.get(f"{self.base_url}{path}", params=params,
+                                    timeout=self.timeout, stream=stream)
+            if not stream:
+                # 流式请求的网络耗时在读完响应体后由 iter_json 记录
+                PHASE_SECONDS.observe(time.perf_counter() - start, phase='fetch')
+            resp.raise_for_status()
+        except requests.exceptions.ConnectionError as e:
+            self.breaker.record_failure()
+            self._record_error('connection')
+            raise ActivityWatchUnavailable("ActivityWatch服务未运行") from e
+        except requests.exceptions.Timeout as e:
+            self.breaker.record_failure()
+            self._record_error('timeout')
+            raise ActivityWatchUnavailable("请求超时") from e
+        except requests.exceptions.HTTPError as e:
+            # 4xx 是请求本身的问题，不计入熔断
+            if e.response is not None and e.response.status_code >= 500:
+                self.breaker.record_failure()
+                self._record_error('http_5xx')
+            else:
+                self.breaker.record_success()
+                self._record_error('http_4xx')
+            raise ActivityWatchUnavailable(f"获取数据出错: {e}") from e
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            self._record_error('other')
+            raise ActivityWatchUnavailable(f"获取数据出错: {e}") from e
+
+        self.breaker.record_success()
+        return resp
+
+    def _record_error(self, error_type):
+        UPSTREAM_ERRORS.inc(base_url=self.base_url, type=error_type)
+
+    def get_json(self, path, params=None):
+        resp = self.get(path, params=params)
+        try:
+            with PHASE_SECONDS.time(phase='decode'):
+                return resp.json()
+        except ValueError as e:
+            self._record_error('invalid_json')
+            raise ActivityWatchUnavailable(f"响应不是有效的JSON: {e}") from e
+
+    def iter_json(self, path, params=None, chunk_size=65536):
+        """以流的方式请求返回 JSON 数组的接口，边下载边逐个产出元素"""
+        resp = self.get(path, params=params, stream=True)
+        read_time = 0.0  # 等待响应体数据的时间
+        total_time = 0.0  # 读取并解析元素的总时间，减去 read_time 即为解析耗时
+
+        def timed_chunks():
+            nonlocal read_time
+            chunks = resp.iter_content(chunk_size)
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                read_time += time.perf_counter() - start
+                if chunk is None:
+                    return
+                yield chunk
+
+        elements = iter_json_array(timed_chunks())
+        try:
+            while True:
+                start = time.perf_counter()
+                element = next(elements, _END)
+                total_time += time.perf_counter() - start
+                if element is _END:
+                    return
+                yield element
+        except ValueError as e:
+            self._record_error('invalid_json')
+            raise ActivityWatchUnavailable(f"响应不是有效的JSON: {e}") from e
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            self._record_error('stream')
+            raise ActivityWatchUnavailable(f"读取响应出错: {e}") from e
+        finally:
+            resp.close()
+            PHASE_SECONDS.observe(resp.elapsed.total_seconds() + read_time, phase='fetch')
+            PHASE_SECONDS.observe(max(0.0, total_time - read_time), phase='decode')
+
+    def close(self):
+        self.session.close()
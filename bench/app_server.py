@@ -0,0 +1,55 @@
+"""基准测试用的 aw-finder 进程
+
+由 bench/run.py 启动：在导入 main 之前通过环境变量把数据源指向模拟服务器、把本地存储放到临时文件，
+完成首次同步后创建应用（本进程负责同步）并在指定端口提供服务，运行状态以 "BENCH {json}" 行输出到标准输出。
+收到 SIGTERM 后停止服务并输出进程的峰值内存。
+"""
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不统计峰值内存
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def report(**fields):
+    print("BENCH " + json.dumps(fields), flush=True)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def main():
+    port = int(sys.argv[1])
+
+    import main as app_main
+    from werkzeug.serving import make_server
+
+    start = time.perf_counter()
+    count = app_main.sync_event_store()
+    sync_seconds = time.perf_counter() - start
+    app = app_main.create_app()
+
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    signal.signal(signal.SIGTERM, lambda *args: threading.Thread(target=server.shutdown).start())
+    report(ready=True, port=port, synced_events=count, sync_seconds=sync_seconds, rss_after_sync_mb=peak_rss_mb())
+
+    server.serve_forever()
+    app_main.ingest_scheduler.stop(wait=False)
+    report(peak_rss_mb=peak_rss_mb())
+
+
+if __name__ == '__main__':
+    main()
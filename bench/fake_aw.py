@@ -0,0 +1,232 @@
+"""模拟的 ActivityWatch 服务器，用于基准测试
+
+提供 aw-finder 用到的几个接口（bucket 元数据、事件列表、事件数），数据由随机种子确定性生成：
+事件均匀铺满最近 --hours 小时，应用和标题按 Zipf 分布抽取，接近真实使用中少数应用占大头的情况；
+同时提供同一主机的 afk bucket，活跃和离开交替出现。
+可以设置每个请求的额外延迟和失败率（返回 500），模拟网络慢或服务不稳定。
+
+单独运行：
+    python bench/fake_aw.py --port 5600 --events 100000 --latency 0.02 --failure-rate 0.05
+"""
+import argparse
+import bisect
+import itertools
+import json
+import random
+import threading
+import time
+
+from array import array
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+APP_NAMES = [
+    'chrome.exe', 'Code.exe', 'WeChat.exe', 'explorer.exe', 'WindowsTerminal.exe', 'msedge.exe',
+    'QQ.exe', 'Feishu.exe', 'Spotify.exe', 'Notion.exe', 'steam.exe', 'obs64.exe',
+]
+
+
+def zipf_cum_weights(n, s=1.1):
+    return list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+
+class SyntheticBucket:
+    """一个合成的窗口 bucket，事件按开始时间升序存成几列数组，查询时再序列化"""
+
+    def __init__(self, bucket_id, events, hours=168, apps=40, titles_per_app=300, seed=0, now=None):
+        self.bucket_id = bucket_id
+        rng = random.Random(seed)
+        now = now if now is not None else time.time()
+        start = now - hours * 3600
+        gap = hours * 3600 / max(events, 1)
+
+        self.app_names = (APP_NAMES + [f"app{i}.exe" for i in range(len(APP_NAMES), apps)])[:apps]
+        app_codes = rng.choices(range(apps), cum_weights=zipf_cum_weights(apps), k=events)
+        title_codes = rng.choices(range(titles_per_app), cum_weights=zipf_cum_weights(titles_per_app), k=events)
+
+        # 相邻事件不重叠，结束时间与开始时间同样有序，可以直接二分查找
+        self.starts = array('d', (start + i * gap for i in range(events)))
+        self.durations = array('d', (gap * rng.uniform(0.3, 1.0) for _ in range(events)))
+        self.ends = array('d', (s + d for s, d in zip(self.starts, self.durations)))
+        self.app_codes = array('I', app_codes)
+        self.title_codes = array('I', title_codes)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def metadata(self):
+        return {
+            'id': self.bucket_id,
+            'type': 'currentwindow',
+            'client': 'aw-watcher-window',
+            'hostname': 'bench',
+            'created': datetime.fromtimestamp(self.starts[0] if self.starts else 0, timezone.utc).isoformat(),
+        }
+
+    def event(self, i):
+        app = self.app_names[self.app_codes[i]]
+        return {
+            'id': i + 1,
+            'timestamp': datetime.fromtimestamp(self.starts[i], timezone.utc).isoformat(),
+            'duration': self.durations[i],
+            'data': {'app': app, 'title': f"窗口 {self.title_codes[i]} - {app}"},
+        }
+
+    def query(self, start=None, end=None, limit=None):
+        """与 ActivityWatch 一致：返回与 [start, end] 有交集的事件，最新的在前"""
+        lo = bisect.bisect_left(self.ends, start) if start is not None else 0
+        hi = bisect.bisect_right(self.starts, end) if end is not None else len(self)
+        if limit is not None and limit >= 0:
+            lo = max(lo, hi - limit)
+        return [self.event(i) for i in range(hi - 1, lo - 1, -1)]
+
+
+class SyntheticAfkBucket(SyntheticBucket):
+    """同一主机的 afk bucket：活跃和离开交替出现，每段 5～60 分钟"""
+
+    def __init__(self, bucket_id, hours=168, seed=0, now=None):
+        self.bucket_id = bucket_id
+        rng = random.Random(seed + 1)
+        now = now if now is not None else time.time()
+        t = now - hours * 3600
+        self.starts, self.durations, self.statuses = array('d'), array('d'), []
+        while t < now:
+            duration = rng.uniform(300, 3600)
+            self.starts.append(t)
+            self.durations.append(duration)
+            self.statuses.append('not-afk' if len(self.statuses) % 2 == 0 else 'afk')
+            t += duration
+        self.ends = array('d', (s + d for s, d in zip(self.starts, self.durations)))
+
+    def metadata(self):
+        return dict(super().metadata(), type='afkstatus', client='aw-watcher-afk')
+
+    def event(self, i):
+        return {
+            'id': i + 1,
+            'timestamp': datetime.fromtimestamp(self.starts[i], timezone.utc).isoformat(),
+            'duration': self.durations[i],
+            'data': {'status': self.statuses[i]},
+        }
+
+
+def parse_time(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def afk_bucket_id(bucket_id):
+    return bucket_id.replace('aw-watcher-window_', 'aw-watcher-afk_', 1)
+
+
+class FakeActivityWatch(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, buckets, latency=0.0, failure_rate=0.0, seed=0):
+        super().__init__(address, FakeActivityWatchHandler)
+        self.buckets = {bucket.bucket_id: bucket for bucket in buckets}
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/0"
+
+    def should_fail(self):
+        with self.rng_lock:
+            self.requests += 1
+            failed = self.rng.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+            return failed
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='fake-aw', daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeActivityWatchHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if server.should_fail():
+            return self.send_json({'message': 'injected failure'}, status=500)
+
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        if parts[:2] != ['api', '0']:
+            return self.send_json({'message': 'not found'}, status=404)
+        parts = parts[2:]
+
+        if parts == ['info']:
+            return self.send_json({'hostname': 'bench', 'version': 'fake', 'testing': True})
+        if parts == ['buckets']:
+            return self.send_json({bucket_id: bucket.metadata() for bucket_id, bucket in server.buckets.items()})
+        if len(parts) < 2 or parts[0] != 'buckets' or parts[1] not in server.buckets:
+            return self.send_json({'message': 'no such bucket'}, status=404)
+
+        bucket = server.buckets[parts[1]]
+        if len(parts) == 2:
+            return self.send_json(bucket.metadata())
+        if parts[2:] == ['events', 'count']:
+            return self.send_json(len(bucket))
+        if parts[2:] == ['events']:
+            limit = params.get('limit', [None])[0]
+            events = bucket.query(
+                parse_time(params.get('start', [None])[0]),
+                parse_time(params.get('end', [None])[0]),
+                int(limit) if limit is not None else None,
+            )
+            return self.send_json(events)
+        return self.send_json({'message': 'not found'}, status=404)
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟的 ActivityWatch 服务器")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5600)
+    parser.add_argument('--bucket', default='aw-watcher-window_bench')
+    parser.add_argument('--events', type=int, default=10000, help="事件数")
+    parser.add_argument('--hours', type=float, default=168, help="事件覆盖最近多少小时")
+    parser.add_argument('--apps', type=int, default=40, help="应用数")
+    parser.add_argument('--titles', type=int, default=300, help="每个应用的标题数")
+    parser.add_argument('--latency', type=float, default=0.0, help="每个请求额外的延迟秒数")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="请求返回 500 的概率")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    bucket = SyntheticBucket(args.bucket, args.events, args.hours, args.apps, args.titles, args.seed)
+    afk_bucket = SyntheticAfkBucket(afk_bucket_id(args.bucket), args.hours, args.seed)
+    server = FakeActivityWatch((args.host, args.port), [bucket, afk_bucket], args.latency, args.failure_rate, args.seed)
+    print(f"模拟 ActivityWatch 运行在 {server.base_url}，bucket {args.bucket}，{len(bucket)} 个事件")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
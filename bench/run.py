@@ -0,0 +1,315 @@
+"""aw-finder 基准测试
+
+对每种事件规模启动一个模拟 ActivityWatch（bench/fake_aw.py）和一个独立的 aw-finder 进程
+（bench/app_server.py），冷启动同步后对 /、/api/events、/api/stats 的每个时间窗口发起并发请求，
+记录吞吐量、p50/p99 延迟、首次同步耗时和进程峰值内存，并与保存的基线比较。
+
+    python bench/run.py                                  # 默认 1k/10k/100k 事件，与 bench/baseline.json 比较
+    python bench/run.py --sizes 1000,1000000 --latency 0.02 --failure-rate 0.05
+    python bench/run.py --save-baseline                  # 把本次结果写入基线
+
+默认关闭响应缓存（RESPONSE_CACHE_TTL=0），测的是每个请求实际的查询和渲染开销；加 --cache 测缓存命中时的表现。
+与基线相比延迟变慢或吞吐量下降超过 --tolerance 时列为退化，并以退出码 1 结束。
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from rich import print
+from rich.table import Table
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_aw import FakeActivityWatch, SyntheticAfkBucket, SyntheticBucket, afk_bucket_id  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+ENDPOINTS = ['/', '/api/events', '/api/stats']
+WINDOWS = [1, 6, 24, 72, 168]
+BUCKET_ID = 'aw-watcher-window_bench'
+READY_TIMEOUT = 1800  # 等待 aw-finder 首次同步完成的最长秒数（1M 事件需要较久）
+# 绝对变化小于这些值时不算退化，避免很小的数字上的抖动被放大成百分比
+MIN_ABSOLUTE_CHANGE = {'p50_ms': 2, 'p99_ms': 5, 'rps': 0, 'sync_seconds': 0.5, 'peak_rss_mb': 10}
+
+
+def git_revision():
+    """当前代码的 git 提交，用来判断基线是否是在最新代码上生成的；不在 git 仓库中时返回 None"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(values, p):
+    if len(values) < 2:
+        return values[0] if values else None
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1]
+
+
+def start_app(base_url, port, db_path, cache):
+    env = dict(os.environ)
+    env.update({
+        'AW_SOURCES': json.dumps([{'name': 'bench', 'base_url': base_url, 'bucket': BUCKET_ID}]),
+        'EVENT_DB_PATH': db_path,
+        'SOURCE_TIMEOUT': str(READY_TIMEOUT),
+        'PYTHONUNBUFFERED': '1',
+    })
+    if not cache:
+        env['RESPONSE_CACHE_TTL'] = '0'
+    env.pop('DEBUG', None)
+    env.pop('PROFILE_REQUESTS', None)
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'app_server.py'), str(port)],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8', env=env,
+    )
+
+    # 在后台读取输出，避免管道写满阻塞子进程
+    reports = queue.Queue()
+
+    def read_output():
+        for line in process.stdout:
+            if line.startswith('BENCH '):
+                reports.put(json.loads(line[len('BENCH '):]))
+        reports.put(None)
+
+    threading.Thread(target=read_output, daemon=True).start()
+    return process, reports
+
+
+def next_report(reports, timeout):
+    report = reports.get(timeout=timeout)
+    if report is None:
+        raise RuntimeError("aw-finder 进程意外退出")
+    return report
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def measure(url, requests_count, concurrency, warmup):
+    """并发请求 url，返回吞吐量、延迟分位数和失败数"""
+    local = threading.local()
+
+    def fetch(_):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=60)
+            ok = response.status_code == 200 and response.content is not None
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(fetch, range(warmup)))
+        start = time.perf_counter()
+        results = list(pool.map(fetch, range(requests_count)))
+        wall = time.perf_counter() - start
+
+    latencies = [latency for latency, ok in results if ok]
+    return {
+        'requests': requests_count,
+        'errors': requests_count - len(latencies),
+        'rps': len(latencies) / wall if wall else None,
+        'p50_ms': percentile(latencies, 50) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 99) * 1000 if latencies else None,
+    }
+
+
+def run_size(size, args):
+    """对一种事件规模跑完所有接口和时间窗口"""
+    print(f"[{datetime.now()}] 生成 {size} 个合成事件...")
+    bucket = SyntheticBucket(BUCKET_ID, size, apps=args.apps, titles_per_app=args.titles, seed=args.seed)
+    afk_bucket = SyntheticAfkBucket(afk_bucket_id(BUCKET_ID), seed=args.seed)
+    fake = FakeActivityWatch(('127.0.0.1', 0), [bucket, afk_bucket], args.latency, args.failure_rate, args.seed)
+    fake.start()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix='aw-bench-') as tmp:
+        process, reports = start_app(fake.base_url, port, os.path.join(tmp, 'events.db'), args.cache)
+        try:
+            ready = next_report(reports, READY_TIMEOUT)
+            print(f"[{datetime.now()}] 同步 {ready['synced_events']} 个事件耗时 {ready['sync_seconds']:.2f} 秒")
+
+            results = {}
+            for endpoint in args.endpoints:
+                for hours in args.windows:
+                    url = f"http://127.0.0.1:{port}{endpoint}?hours={hours}"
+                    result = measure(url, args.requests, args.concurrency, args.warmup)
+                    results[f"{size}|{endpoint}|{hours}"] = result
+                    print(f"[{datetime.now()}] {size} 事件 {endpoint}?hours={hours}: "
+                          f"{format_number(result['rps'])} req/s, p50 {format_number(result['p50_ms'])} ms, "
+                          f"p99 {format_number(result['p99_ms'])} ms, 失败 {result['errors']}")
+        finally:
+            process.terminate()
+            try:
+                final = next_report(reports, 30)
+            except (queue.Empty, RuntimeError):
+                final = {}
+            process.wait(timeout=30)
+    fake.shutdown()
+    fake.server_close()
+
+    summary = {
+        'sync_seconds': ready['sync_seconds'],
+        'peak_rss_mb': final.get('peak_rss_mb'),
+        'upstream_requests': fake.requests,
+        'upstream_failures': fake.failures,
+    }
+    return results, summary
+
+
+def compare(current, baseline, tolerance):
+    """与基线比较，返回 {键: {指标: 相对变化}} 和退化列表"""
+    changes = {}
+    regressions = []
+    for key, result in current.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        change = {}
+        for metric in ('p50_ms', 'p99_ms', 'rps', 'sync_seconds', 'peak_rss_mb'):
+            if result.get(metric) is None or not base.get(metric):
+                continue
+            change[metric] = result[metric] / base[metric] - 1
+            worse = -change[metric] if metric == 'rps' else change[metric]
+            if worse > tolerance and abs(result[metric] - base[metric]) >= MIN_ABSOLUTE_CHANGE[metric]:
+                regressions.append(f"{key} {metric}: {base[metric]:.1f} -> {result[metric]:.1f}")
+        changes[key] = change
+    return changes, regressions
+
+
+def format_number(value):
+    return '-' if value is None else f"{value:.1f}"
+
+
+def format_change(change):
+    if change is None:
+        return '-'
+    color = 'red' if change > 0 else 'green'
+    return f"[{color}]{change:+.0%}[/{color}]"
+
+
+def render(results, summaries, changes):
+    table = Table(title="接口延迟与吞吐量")
+    for column in ('事件数', '接口', '小时', 'req/s', 'p50 ms', 'p99 ms', '错误', 'Δp50', 'Δp99', 'Δreq/s'):
+        table.add_column(column, justify='right', no_wrap=True)
+    for key, result in results.items():
+        size, endpoint, hours = key.split('|')
+        change = changes.get(key, {})
+        table.add_row(
+            size, endpoint, hours, format_number(result['rps']), format_number(result['p50_ms']),
+            format_number(result['p99_ms']),
+            str(result['errors']), format_change(change.get('p50_ms')), format_change(change.get('p99_ms')),
+            format_change(-change['rps'] if 'rps' in change else None),
+        )
+    print(table)
+
+    table = Table(title="同步与内存")
+    for column in ('事件数', '首次同步 s', '峰值内存 MB', '上游请求', '上游失败', 'Δ同步', 'Δ内存'):
+        table.add_column(column, justify='right', no_wrap=True)
+    for size, summary in summaries.items():
+        change = changes.get(size, {})
+        table.add_row(
+            size, f"{summary['sync_seconds']:.2f}", format_number(summary['peak_rss_mb']),
+            str(summary['upstream_requests']), str(summary['upstream_failures']),
+            format_change(change.get('sync_seconds')), format_change(change.get('peak_rss_mb')),
+        )
+    print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="aw-finder 基准测试")
+    parser.add_argument('--sizes', default='1000,10000,100000', help="逗号分隔的事件数，例如 1000,1000000")
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--windows', default=','.join(map(str, WINDOWS)), help="逗号分隔的 hours 参数")
+    parser.add_argument('--requests', type=int, default=100, help="每个接口每个时间窗口的请求数")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--apps', type=int, default=40)
+    parser.add_argument('--titles', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.0, help="模拟 ActivityWatch 每个请求的延迟秒数")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="模拟 ActivityWatch 请求失败的概率")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', action='store_true', help="保留响应缓存")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="把本次结果写入基线文件")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="允许的相对退化比例")
+    parser.add_argument('--output', help="把本次结果另存为 JSON")
+    args = parser.parse_args()
+    args.endpoints = args.endpoints.split(',')
+    args.windows = [int(hours) for hours in args.windows.split(',')]
+
+    results = {}
+    summaries = {}
+    for size in (int(size) for size in args.sizes.split(',')):
+        size_results, summaries[str(size)] = run_size(size, args)
+        results.update(size_results)
+
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'latency': args.latency,
+            'failure_rate': args.failure_rate,
+            'cache': args.cache,
+        },
+        'results': results,
+        'sizes': summaries,
+    }
+
+    changes, regressions = {}, []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        base_commit = baseline.get('meta', {}).get('commit')
+        if base_commit != report['meta']['commit']:
+            print(f"基线生成于提交 {base_commit or '未知'}，当前为 {report['meta']['commit'] or '未知'}；"
+                  f"代码改动后请用 --save-baseline 重新生成")
+        current = dict(results)
+        current.update(summaries)
+        base = dict(baseline.get('results', {}))
+        base.update(baseline.get('sizes', {}))
+        changes, regressions = compare(current, base, args.tolerance)
+
+    render(results, summaries, changes)
+
+    for path in filter(None, [args.output, args.baseline if args.save_baseline else None]):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {path}")
+
+    if regressions:
+        print(f"与基线相比有 {len(regressions)} 项退化超过 {args.tolerance:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class _Flight:
+    """一次正在进行中的加载，后到的请求等待它的结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """带过期时间和容量上限（LRU 淘汰）的缓存，并对同一个 key 的并发加载做合并（single-flight）"""
+
+    def __init__(self, maxsize=64, ttl=10):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (过期时间, 值)
+        self._flights = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._get_locked(key, default)
+
+    def _get_locked(self, key, default):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """命中缓存直接返回；未命中时只有第一个请求调用 loader，同时到达的其他请求共享它的结果"""
+        missing = object()
+        with self._lock:
+            value = self._get_locked(key, missing)
+            if value is not missing:
+                self.hits += 1
+                return value
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+            else:
+                self.hits += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+            self.set(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,157 @@
+import json
+import os
+import re
+import sys
+
+from collections import deque
+from functools import lru_cache
+
+
+UNCATEGORIZED = '未分类'
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 自动机：一次扫描文本找出所有出现的关键词，耗时与文本长度成正比，与关键词数无关"""
+
+    def __init__(self, keywords):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]  # 状态 -> 在这里结束的 (关键词长度, 值)
+        for word, value in keywords:
+            node = 0
+            for char in word:
+                child = self._goto[node].get(char)
+                if child is None:
+                    child = len(self._goto)
+                    self._goto[node][char] = child
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = child
+            self._output[node].append((len(word), value))
+
+        # 按层次计算失败指针，并把失败状态的输出并入当前状态
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for char, child in self._goto[node].items():
+                pending.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def __bool__(self):
+        return len(self._goto) > 1
+
+    def iter_matches(self, text):
+        """生成 (开始位置, 结束位置, 值)，同一位置结束的多个关键词都会生成"""
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for length, value in output[node]:
+                yield i + 1 - length, i + 1, value
+
+
+class CategoryRules:
+    """把 (应用, 标题) 映射到用户定义的分类，例如“工作”“娱乐”
+
+    每条规则是 {"category": "工作", "regex": "Code\\.exe|PyCharm"} 或 {"category": "娱乐", "contains": "bilibili"}，
+    可选 "field": "app" / "title" 只匹配应用名或标题（默认两者任一匹配即可），"ignore_case" 默认为 true。
+    规则按顺序排优先级，第一条匹配的规则决定分类，都不匹配时为 UNCATEGORIZED。
+
+    规则不逐条尝试：不区分大小写的 contains 规则合成一个 Aho-Corasick 自动机，扫描一遍文本得到所有命中的关键词；
+    其余规则合成一个正则，匹配对象是 "应用\\n标题"，每条规则一个分支，re 按顺序尝试分支，匹配到的外层分组对应
+    第一条命中的规则。两边取规则序号较小的一个。关键词规则的开销与规则数无关，规则很多时尽量写成 contains。
+    同一 (应用, 标题) 的结果用 LRU 缓存，键是驻留（intern）后的字符串，重复出现的标题只分类一次。
+    """
+
+    def __init__(self, rules=(), cache_size=65536):
+        self.rules = list(rules)
+        self._categories = []  # 规则序号 -> 分类
+        self._fields = []  # 规则序号 -> 匹配的字段
+        self._groups = {}  # 正则的外层分组编号 -> 规则序号
+        keywords = []
+        branches = []
+        group = 1
+        for i, rule in enumerate(self.rules):
+            category = rule.get('category')
+            if not category:
+                raise ValueError(f"分类规则 {i} 缺少 category")
+            field = rule.get('field')
+            if field not in (None, 'app', 'title'):
+                raise ValueError(f"分类规则 {i} 的 field 只能是 app 或 title")
+            ignore_case = rule.get('ignore_case', True)
+            self._categories.append(category)
+            self._fields.append(field)
+
+            if 'contains' in rule and ignore_case and rule['contains']:
+                keywords.append((rule['contains'].lower(), i))
+                continue
+            if 'regex' in rule:
+                pattern = rule['regex']
+            elif 'contains' in rule:
+                pattern = re.escape(rule['contains'])
+            else:
+                raise ValueError(f"分类规则 {i} 需要 regex 或 contains")
+            try:
+                inner_groups = re.compile(pattern).groups
+            except re.error as e:
+                raise ValueError(f"分类规则 {i} 的正则无效: {e}") from None
+
+            if field == 'app':
+                prefix = '.*?'  # 应用名在第一行，. 不跨过换行
+            elif field == 'title':
+                prefix = '[^\\n]*\\n.*?'
+            else:
+                prefix = '(?s:.*?)'
+            branches.append(f"({prefix}(?{'i' if ignore_case else '-i'}:{pattern}))")
+            self._groups[group] = i
+            group += 1 + inner_groups
+
+        self._keywords = KeywordAutomaton(keywords)
+        self._pattern = None
+        if branches:
+            # MULTILINE：规则里的 ^ 和 $ 分别匹配应用名、标题的开头和结尾
+            try:
+                self._pattern = re.compile('(?:' + '|'.join(branches) + ')', re.MULTILINE)
+            except re.error as e:
+                raise ValueError(f"分类规则无法合并: {e}") from None
+        self._classify = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, app, title):
+        best = len(self.rules)
+        if self._keywords:
+            app_lower = app.lower()
+            split = len(app_lower)
+            for start, end, i in self._keywords.iter_matches(f"{app_lower}\n{title.lower()}"):
+                if i < best:
+                    field = self._fields[i]
+                    if field is None or (field == 'app' and end <= split) or (field == 'title' and start > split):
+                        best = i
+        if self._pattern is not None:
+            match = self._pattern.match(f"{app}\n{title}")
+            if match is not None:
+                best = min(best, self._groups[match.lastindex])
+        return self._categories[best] if best < len(self.rules) else UNCATEGORIZED
+
+    def classify(self, app, title):
+        """返回 (应用, 标题) 的分类"""
+        # 换行是应用名和标题的分隔符，标题里的换行换成空格
+        return self._classify(sys.intern(app), sys.intern(title.replace('\n', ' ')))
+
+    def cache_info(self):
+        return self._classify.cache_info()
+
+
+def load_category_rules(cache_size=65536):
+    """读取分类规则：环境变量 CATEGORY_RULES（JSON 字符串）或 CATEGORY_RULES_FILE（JSON 文件路径），都没有时不分类"""
+    raw = os.getenv("CATEGORY_RULES")
+    if not raw and os.getenv("CATEGORY_RULES_FILE"):
+        with open(os.getenv("CATEGORY_RULES_FILE"), encoding='utf-8') as f:
+            raw = f.read()
+    return CategoryRules(json.loads(raw) if raw else [], cache_size)
@@ -0,0 +1,506 @@
+import json
+import math
+import sqlite3
+import threading
+import time
+
+import timestamps
+
+from columnar import EventBatch
+
+ROLLUP_SLOT = 300  # 预聚合时间桶宽度（秒）
+ROLLUP_COARSE_SLOT = 3600  # 超过保留期后预聚合降采样到的时间桶宽度（秒）
+DAY = 86400
+
+# 构建 EventBatch 所需的列：(开始时间, 时长, 应用名, 标题)
+_BATCH_COLUMNS = """ts, duration,
+    COALESCE(json_extract(data, '$.app'), 'Unknown'),
+    COALESCE(json_extract(data, '$.title'), 'Unknown')"""
+
+
+class EventStore:
+    """本地事件存储：把 ActivityWatch 的窗口事件增量写入 SQLite，供页面和 API 按时间范围查询
+
+    传入 archive（SegmentArchive）时，已经结束的天可以归档成压缩的分段文件，超过保留期的原始事件
+    从 SQLite 删除、细粒度预聚合降采样；查询早于保留期的范围时，需要原始事件的部分从归档读取。
+    """
+
+    def __init__(self, path, archive=None):
+        self.path = path
+        self.archive = archive
+        self._writes = 0  # 本连接每次写入新数据后递增
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS events (
+                    bucket    TEXT    NOT NULL,
+                    event_id  INTEGER NOT NULL,
+                    timestamp TEXT    NOT NULL,
+                    ts        REAL    NOT NULL,
+                    end_ts    REAL    NOT NULL,
+                    duration  REAL    NOT NULL,
+                    data      TEXT    NOT NULL,
+                    PRIMARY KEY (bucket, event_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_events_bucket_end ON events (bucket, end_ts);
+                CREATE INDEX IF NOT EXISTS idx_events_bucket_ts ON events (bucket, ts);
+                CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts);
+                CREATE TABLE IF NOT EXISTS write_log (
+                    seq     INTEGER PRIMARY KEY AUTOINCREMENT,
+                    bucket  TEXT    NOT NULL,
+                    min_ts  REAL    NOT NULL,
+                    written REAL    NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS buckets (
+                    bucket        TEXT PRIMARY KEY,
+                    synced_until  REAL,
+                    duration_unit TEXT,
+                    sync_time     REAL,
+                    sync_ok       INTEGER,
+                    sync_error    TEXT,
+                    retained_from     REAL,
+                    downsampled_until REAL
+                );
+            """)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(buckets)")}
+            for column, column_type in (('duration_unit', 'TEXT'), ('sync_time', 'REAL'),
+                                        ('sync_ok', 'INTEGER'), ('sync_error', 'TEXT'),
+                                        ('retained_from', 'REAL'), ('downsampled_until', 'REAL')):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE buckets ADD COLUMN {column} {column_type}")
+            has_rollup = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup'"
+            ).fetchone()
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollup (
+                    bucket   TEXT    NOT NULL,
+                    slot     INTEGER NOT NULL,
+                    app      TEXT    NOT NULL,
+                    title    TEXT    NOT NULL,
+                    duration REAL    NOT NULL,
+                    count    INTEGER NOT NULL,
+                    PRIMARY KEY (bucket, slot, app, title)
+                )
+            """)
+            if not has_rollup:
+                # 旧版本数据库只有 events 表，从已有事件重建预聚合
+                self._conn.execute(f"""
+                    INSERT INTO rollup (bucket, slot, app, title, duration, count)
+                    SELECT bucket, CAST(ts / {ROLLUP_SLOT} AS INTEGER) * {ROLLUP_SLOT},
+                           COALESCE(json_extract(data, '$.app'), 'Unknown'),
+                           COALESCE(json_extract(data, '$.title'), 'Unknown'),
+                           SUM(duration), COUNT(*)
+                    FROM events
+                    GROUP BY 1, 2, 3, 4
+                """)
+
+    def upsert_events(self, bucket, events, scale=1.0, rollup=True):
+        """写入事件，已存在的事件（心跳合并后时长变长）按 id 覆盖，同时更新预聚合桶，返回写入条数
+
+        scale 是把原始时长换算成秒的系数，存储中的时长统一以秒为单位。
+        rollup=False 用于 afk 等不按应用统计的 bucket，不写预聚合。
+        """
+        rows = []
+        for event in events:
+            timestamp = event.get('timestamp')
+            ts = timestamps.to_epoch(timestamp)
+            if ts is None:
+                continue
+            duration = (event.get('duration', 0) or 0) * scale
+            # 没有 id 的事件用开始时间（微秒）作为主键
+            event_id = event.get('id')
+            if event_id is None:
+                event_id = int(ts * 1000000)
+            rows.append((event_id, timestamp, ts, duration, event.get('data', {})))
+
+        if not rows:
+            return 0
+
+        with self._lock, self._conn:
+            changed_from = math.inf  # 这一批实际改动的事件中最早的开始时间（含改动前的）
+            for event_id, timestamp, ts, duration, data in rows:
+                data_json = json.dumps(data, ensure_ascii=False)
+                old = self._conn.execute(
+                    "SELECT ts, duration, data FROM events WHERE bucket = ? AND event_id = ?",
+                    (bucket, event_id)
+                ).fetchone()
+                if old == (ts, duration, data_json):
+                    # 增量同步向前重叠取回的事件大多没有变化
+                    continue
+                changed_from = min(changed_from, ts, old[0] if old is not None else ts)
+                if old is not None and rollup:
+                    old_data = json.loads(old[2])
+                    self._add_to_rollup(bucket, old[0], old_data, -old[1], -1)
+
+                self._conn.execute("""
+                    INSERT INTO events (bucket, event_id, timestamp, ts, end_ts, duration, data)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (bucket, event_id) DO UPDATE SET
+                        timestamp = excluded.timestamp,
+                        ts = excluded.ts,
+                        end_ts = excluded.end_ts,
+                        duration = excluded.duration,
+                        data = excluded.data
+                """, (bucket, event_id, timestamp, ts, ts + duration, duration, data_json))
+                if rollup:
+                    self._add_to_rollup(bucket, ts, data, duration, 1)
+
+            if changed_from != math.inf:
+                self._log_write(bucket, changed_from)
+            self._conn.execute("DELETE FROM rollup WHERE bucket = ? AND count <= 0", (bucket,))
+            self._writes += 1
+        return len(rows)
+
+    def _log_write(self, bucket, min_ts):
+        """记录一次写入改动的最早事件开始时间，调用方需持有锁并处于事务中"""
+        self._conn.execute(
+            "INSERT INTO write_log (bucket, min_ts, written) VALUES (?, ?, ?)", (bucket, min_ts, time.time())
+        )
+
+    def changed_since(self, bucket, seq):
+        """seq 之后的写入改动过的最早事件开始时间，返回 (最早开始时间, 当前 seq)
+
+        seq 为 None 时只返回当前 seq；没有改动时最早开始时间为 None；seq 之后的记录已被清理、
+        无法确定改动范围时为 -inf。增量维护的派生数据（专注时段）用它发现同步写入的、比已处理部分更早的事件：
+        同步按时间倒序分批写入，中途读到的只是较新的一部分。
+        """
+        with self._lock:
+            current = self._conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'write_log'"
+            ).fetchone()
+            current = current[0] if current else 0
+            if seq is None or seq >= current:
+                return None, current
+            oldest = self._conn.execute("SELECT MIN(seq) FROM write_log").fetchone()[0]
+            if oldest is None or oldest > seq + 1:
+                return -math.inf, current
+            min_ts = self._conn.execute(
+                "SELECT MIN(min_ts) FROM write_log WHERE bucket = ? AND seq > ?", (bucket, seq)
+            ).fetchone()[0]
+        return min_ts, current
+
+    def prune_write_log(self, before):
+        """删除早于 before（epoch 秒）的写入记录，之后才来读取的一方会得到 -inf 并从头重建"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM write_log WHERE written < ?", (before,))
+
+    @property
+    def version(self):
+        """数据版本，用作响应缓存键的一部分
+
+        由本连接的写入次数和 SQLite 的 data_version 组成，后者在其他进程提交写入后变化，
+        所以只读的 Web 进程也能感知同步进程写入的新数据。
+        """
+        with self._lock:
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return (self._writes, data_version)
+
+    def _add_to_rollup(self, bucket, ts, data, duration, count):
+        """把一个事件的时长计入（或扣出）它开始时间所在的时间桶，调用方需持有锁并处于事务中"""
+        slot = int(ts // ROLLUP_SLOT) * ROLLUP_SLOT
+        self._conn.execute("""
+            INSERT INTO rollup (bucket, slot, app, title, duration, count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (bucket, slot, app, title) DO UPDATE SET
+                duration = duration + excluded.duration,
+                count = count + excluded.count
+        """, (bucket, slot, data.get('app', 'Unknown'), data.get('title', 'Unknown'), duration, count))
+
+    def latest_event(self, bucket):
+        """返回开始时间最晚的事件 (开始时间, 结束时间, data)，没有数据时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ts, end_ts, data FROM events WHERE bucket = ? ORDER BY ts DESC LIMIT 1", (bucket,)
+            ).fetchone()
+        return None if row is None else (row[0], row[1], json.loads(row[2]))
+
+    def synced_until(self, bucket):
+        """返回上一次完整同步时已存储的最新事件开始时间；从未完整同步过时返回 None"""
+        return self._bucket_value(bucket, 'synced_until')
+
+    def retained_from(self, bucket):
+        """SQLite 中保留原始事件的起始时间（整天），更早的原始事件只在归档中；没有删除过时返回 None"""
+        return self._bucket_value(bucket, 'retained_from')
+
+    def downsampled_until(self, bucket):
+        """预聚合在这个时间之前已降采样为 ROLLUP_COARSE_SLOT 宽的桶；没有降采样过时返回 None"""
+        return self._bucket_value(bucket, 'downsampled_until')
+
+    def _bucket_value(self, bucket, column):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {column} FROM buckets WHERE bucket = ?", (bucket,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_synced(self, bucket):
+        """一次同步完整结束后记录同步进度；中途失败时不调用，下次会从旧进度重新同步"""
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO buckets (bucket, synced_until)
+                SELECT ?, MAX(ts) FROM events WHERE bucket = ?
+                ON CONFLICT (bucket) DO UPDATE SET synced_until = excluded.synced_until
+            """, (bucket, bucket))
+
+    def record_sync_status(self, bucket, when, ok, error=None):
+        """记录 bucket 最近一次同步的结果，供不负责同步的进程读取"""
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO buckets (bucket, sync_time, sync_ok, sync_error) VALUES (?, ?, ?, ?)
+                ON CONFLICT (bucket) DO UPDATE SET
+                    sync_time = excluded.sync_time,
+                    sync_ok = excluded.sync_ok,
+                    sync_error = excluded.sync_error
+            """, (bucket, when, int(ok), error))
+
+    def sync_statuses(self):
+        """返回 {bucket: {'time', 'ok', 'error'}}，只包含记录过同步结果的 bucket"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT bucket, sync_time, sync_ok, sync_error FROM buckets WHERE sync_time IS NOT NULL"
+            ).fetchall()
+        return {bucket: {'time': when, 'ok': bool(ok), 'error': error} for bucket, when, ok, error in rows}
+
+    def duration_unit(self, bucket):
+        """返回已记录的 bucket 原始时长单位，尚未检测过时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT duration_unit FROM buckets WHERE bucket = ?", (bucket,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_duration_unit(self, bucket, unit, scale):
+        """记录 bucket 的原始时长单位；此前未换算就写入的事件和预聚合一并乘以 scale 换算成秒"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT duration_unit FROM buckets WHERE bucket = ?", (bucket,)
+            ).fetchone()
+            if row is not None and row[0] is not None:
+                return
+            if scale != 1:
+                self._conn.execute("""
+                    UPDATE events SET duration = duration * ?, end_ts = ts + duration * ?
+                    WHERE bucket = ?
+                """, (scale, scale, bucket))
+                self._conn.execute(
+                    "UPDATE rollup SET duration = duration * ? WHERE bucket = ?", (scale, bucket)
+                )
+                self._log_write(bucket, -math.inf)
+                self._writes += 1
+            self._conn.execute("""
+                INSERT INTO buckets (bucket, duration_unit) VALUES (?, ?)
+                ON CONFLICT (bucket) DO UPDATE SET duration_unit = excluded.duration_unit
+            """, (bucket, unit))
+
+    def query_events_page(self, buckets, start_ts, end_ts, limit, after=None):
+        """分页查询多个 bucket 中与 [start_ts, end_ts] 有重叠的事件
+
+        按 (ts, bucket, event_id) 倒序排列，after 为上一页最后一个事件的这三个值（keyset 分页）。
+        返回 ([(bucket, 事件), ...], 下一页的 after)，没有更多数据时下一页的 after 为 None。
+        """
+        if not buckets:
+            return [], None
+
+        placeholders = ', '.join('?' * len(buckets))
+        sql = f"""
+            SELECT bucket, event_id, timestamp, ts, duration, data FROM events
+            WHERE bucket IN ({placeholders}) AND end_ts >= ? AND ts <= ?
+        """
+        params = [*buckets, start_ts, end_ts]
+        if after is not None:
+            sql += " AND (ts, bucket, event_id) < (?, ?, ?)"
+            params.extend(after)
+        sql += " ORDER BY ts DESC, bucket DESC, event_id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        events = [
+            (bucket, {
+                'id': event_id,
+                'timestamp': timestamp,
+                'duration': duration,
+                'data': json.loads(data),
+            })
+            for bucket, event_id, timestamp, ts, duration, data in rows
+        ]
+        next_after = None
+        if len(rows) == limit:
+            bucket, event_id, _, ts, _, _ = rows[-1]
+            next_after = (ts, bucket, event_id)
+        return events, next_after
+
+    def query_app_title_totals(self, bucket, start_ts, end_ts):
+        """按 (app, title) 汇总与 [start_ts, end_ts] 有重叠的事件，返回 (app, title, duration, count) 列表
+
+        完整落在窗口内的时间桶直接读预聚合表，窗口两端不足一个桶的部分回退到原始事件，
+        因此结果与对原始事件逐条汇总完全一致。已降采样的范围按 ROLLUP_COARSE_SLOT 对齐，
+        已删除原始事件的范围从归档读取两端的事件，结果同样一致。
+        """
+        lo = math.ceil(start_ts / ROLLUP_SLOT) * ROLLUP_SLOT  # 向上取整到桶边界
+        hi = math.floor(end_ts / ROLLUP_SLOT) * ROLLUP_SLOT
+        coarse_until = self.downsampled_until(bucket)
+        if coarse_until is not None:
+            if lo < coarse_until:
+                lo = math.ceil(start_ts / ROLLUP_COARSE_SLOT) * ROLLUP_COARSE_SLOT
+            if hi < coarse_until:
+                hi = math.floor(end_ts / ROLLUP_COARSE_SLOT) * ROLLUP_COARSE_SLOT
+        with self._lock:
+            if hi > lo:
+                rows = self._conn.execute("""
+                    SELECT app, title, SUM(duration), SUM(count) FROM rollup
+                    WHERE bucket = ? AND slot >= ? AND slot < ?
+                    GROUP BY app, title
+                """, (bucket, lo, hi)).fetchall()
+                edge_rows = self._conn.execute(f"""
+                    SELECT {_BATCH_COLUMNS} FROM events
+                    WHERE bucket = ? AND end_ts >= ? AND ts <= ? AND (ts < ? OR ts >= ?)
+                """, (bucket, start_ts, end_ts, lo, hi)).fetchall()
+            else:
+                rows = []
+                edge_rows = self._conn.execute(f"""
+                    SELECT {_BATCH_COLUMNS} FROM events
+                    WHERE bucket = ? AND end_ts >= ? AND ts <= ?
+                """, (bucket, start_ts, end_ts)).fetchall()
+
+        rows.extend(EventBatch.from_rows(edge_rows).app_title_totals())
+        for batch in self._archived_batches(bucket, start_ts, end_ts, (lo, hi) if hi > lo else None):
+            rows.extend(batch.app_title_totals())
+        return rows
+
+    def _archived_batches(self, bucket, start_ts, end_ts, exclude=None):
+        """SQLite 中已删除的原始事件（开始时间早于 retained_from）从归档读取"""
+        retained_from = self.retained_from(bucket)
+        if self.archive is None or retained_from is None or start_ts >= retained_from:
+            return []
+        return self.archive.query_batches(bucket, start_ts, end_ts, before=retained_from, exclude=exclude)
+
+    def query_intervals(self, bucket, start_ts, end_ts):
+        """查询与 [start_ts, end_ts) 有重叠的事件，按开始时间升序返回 (开始, 结束, app, title)"""
+        intervals = []
+        for batch in self._archived_batches(bucket, start_ts, end_ts):
+            intervals.extend(
+                (ts / 1000000, ts / 1000000 + duration, batch.apps[app_code], batch.titles[title_code])
+                for ts, duration, app_code, title_code
+                in zip(batch.timestamps, batch.durations, batch.app_codes, batch.title_codes)
+                if ts / 1000000 + duration > start_ts and ts / 1000000 < end_ts
+            )
+        with self._lock:
+            return intervals + self._conn.execute("""
+                SELECT ts, end_ts,
+                       COALESCE(json_extract(data, '$.app'), 'Unknown'),
+                       COALESCE(json_extract(data, '$.title'), 'Unknown')
+                FROM events
+                WHERE bucket = ? AND end_ts > ? AND ts < ?
+                ORDER BY ts
+            """, (bucket, start_ts, end_ts)).fetchall()
+
+    def query_status_intervals(self, bucket, start_ts, end_ts, status='not-afk'):
+        """查询 afk bucket 中与 [start_ts, end_ts) 有重叠、状态为 status 的区间，按开始时间升序返回 (开始, 结束)"""
+        with self._lock:
+            return self._conn.execute("""
+                SELECT ts, end_ts FROM events
+                WHERE bucket = ? AND end_ts > ? AND ts < ? AND json_extract(data, '$.status') = ?
+                ORDER BY ts
+            """, (bucket, start_ts, end_ts, status)).fetchall()
+
+    def archive_days(self, untils):
+        """把每个 bucket 开始时间早于 untils[bucket] 的整天事件写入归档（每天一个分段文件），返回归档的事件数
+
+        只归档尚未归档过、且原始事件仍在 SQLite 中的天；until 需要早于同步时可能被更新的事件。
+        """
+        if self.archive is None:
+            return 0
+        pending = {}  # 天的开始时间 -> 需要归档的 bucket
+        for bucket, until in untils.items():
+            until = math.floor(until / DAY) * DAY
+            archived = self.archive.archived_days(bucket)
+            retained_from = self.retained_from(bucket) or 0
+            with self._lock:
+                days = self._conn.execute(f"""
+                    SELECT DISTINCT CAST(ts / {DAY} AS INTEGER) * {DAY} FROM events
+                    WHERE bucket = ? AND ts >= ? AND ts < ?
+                """, (bucket, retained_from, until)).fetchall()
+            for (day,) in days:
+                if day not in archived:
+                    pending.setdefault(day, []).append(bucket)
+
+        count = 0
+        for day, day_buckets in sorted(pending.items()):
+            batches = {}
+            for bucket in day_buckets:
+                with self._lock:
+                    rows = self._conn.execute(f"""
+                        SELECT {_BATCH_COLUMNS} FROM events
+                        WHERE bucket = ? AND ts >= ? AND ts < ?
+                        ORDER BY ts
+                    """, (bucket, day, day + DAY)).fetchall()
+                batches[bucket] = EventBatch.from_rows(rows)
+            count += self.archive.write_day(day, batches)
+        return count
+
+    def apply_retention(self, bucket, raw_before=None, downsample_before=None):
+        """删除已归档的、早于 raw_before 的原始事件，并把早于 downsample_before 的预聚合合并成 ROLLUP_COARSE_SLOT 宽的桶
+
+        两个时间都向下取整到天；还没有归档的天不会删除。预聚合统计的是开始时间落在桶内的事件，合并后总数不变。
+        """
+        if raw_before is not None and self.archive is not None:
+            raw_before = math.floor(raw_before / DAY) * DAY
+            archived = self.archive.archived_days(bucket)
+            with self._lock:
+                days = self._conn.execute(f"""
+                    SELECT DISTINCT CAST(ts / {DAY} AS INTEGER) * {DAY} FROM events
+                    WHERE bucket = ? AND ts < ?
+                """, (bucket, raw_before)).fetchall()
+            unarchived = [day for (day,) in days if day not in archived]
+            if unarchived:
+                raw_before = min(unarchived)
+            if raw_before > (self.retained_from(bucket) or 0):
+                with self._lock, self._conn:
+                    self._conn.execute("DELETE FROM events WHERE bucket = ? AND ts < ?", (bucket, raw_before))
+                    self._conn.execute("""
+                        INSERT INTO buckets (bucket, retained_from) VALUES (?, ?)
+                        ON CONFLICT (bucket) DO UPDATE SET retained_from = excluded.retained_from
+                    """, (bucket, raw_before))
+                    self._writes += 1
+
+        if downsample_before is not None:
+            downsample_before = math.floor(downsample_before / DAY) * DAY
+            if downsample_before > (self.downsampled_until(bucket) or 0):
+                with self._lock, self._conn:
+                    self._conn.execute("""
+                        CREATE TEMP TABLE IF NOT EXISTS rollup_coarse (
+                            slot INTEGER, app TEXT, title TEXT, duration REAL, count INTEGER
+                        )
+                    """)
+                    self._conn.execute("DELETE FROM rollup_coarse")
+                    self._conn.execute(f"""
+                        INSERT INTO rollup_coarse
+                        SELECT CAST(slot / {ROLLUP_COARSE_SLOT} AS INTEGER) * {ROLLUP_COARSE_SLOT}, app, title,
+                               SUM(duration), SUM(count)
+                        FROM rollup WHERE bucket = ? AND slot < ?
+                        GROUP BY 1, 2, 3
+                    """, (bucket, downsample_before))
+                    self._conn.execute("DELETE FROM rollup WHERE bucket = ? AND slot < ?", (bucket, downsample_before))
+                    self._conn.execute("""
+                        INSERT INTO rollup (bucket, slot, app, title, duration, count)
+                        SELECT ?, slot, app, title, duration, count FROM rollup_coarse
+                    """, (bucket,))
+                    self._conn.execute("""
+                        INSERT INTO buckets (bucket, downsampled_until) VALUES (?, ?)
+                        ON CONFLICT (bucket) DO UPDATE SET downsampled_until = excluded.downsampled_until
+                    """, (bucket, downsample_before))
+                    self._writes += 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        if self.archive is not None:
+            self.archive.close()
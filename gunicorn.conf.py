@@ -0,0 +1,17 @@
+# gunicorn 配置：gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+# 多个进程并行处理请求，一个很慢的 7 天统计不会占住其他请求
+workers = int(os.getenv("WEB_CONCURRENCY", min(multiprocessing.cpu_count(), 4)))
+# 每个进程再用线程处理并发连接；/api/stream 的推送连接会一直占用一个线程
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 8))
+# 每个进程最多 STREAM_MAX_CLIENTS 个推送连接，默认线程数的一半，其余线程留给普通请求；
+# 能同时打开的页面数约为 workers * STREAM_MAX_CLIENTS，页面多时调大 WEB_THREADS 或 STREAM_MAX_CLIENTS
+os.environ.setdefault("STREAM_MAX_CLIENTS", str(max(1, threads // 2)))
+# 不预加载：每个工作进程自己打开数据库连接、参与同步选主，不共享 fork 前的连接和线程
+preload_app = False
+timeout = 120
+graceful_timeout = 30
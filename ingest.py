@@ -0,0 +1,38 @@
+"""独立的同步进程：只负责把 ActivityWatch 的数据同步到本地存储，不提供 Web 服务
+
+与 AW_INGEST=off 的 Web 进程配合使用：python ingest.py
+已有其他进程持有同步锁时等待，直到它退出后接手。
+"""
+import signal
+import threading
+import time
+
+from datetime import datetime
+
+from rich import print
+
+import main
+
+
+def run():
+    while not main.leader_lock.try_acquire():
+        print(f"[{datetime.now()}] 已有其他进程负责同步，{main.INTERVAL} 秒后重试")
+        time.sleep(main.INTERVAL)
+
+    main.ingest_state['role'] = 'leader'
+    main.sync_event_store()
+    main.start_scheduler()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop.set())
+    try:
+        while not stop.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    main.ingest_scheduler.stop()
+    main.leader_lock.release()
+
+
+if __name__ == '__main__':
+    run()
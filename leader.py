@@ -0,0 +1,51 @@
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，改用 msvcrt 的文件区域锁
+    fcntl = None
+    import msvcrt
+
+
+class LeaderLock:
+    """基于文件锁的进程间选主
+
+    同一时间只有一个进程能持有锁，由它负责向 ActivityWatch 同步；持有者退出（包括崩溃）时
+    操作系统会自动释放锁，其他进程下一次尝试时接手。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        """不阻塞地尝试获取锁，成功或本进程已持有时返回 True"""
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        # 写入持有者的进程号，方便排查是哪个进程在同步
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
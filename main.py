@@ -1,16 +1,44 @@
-import requests
-import schedule
 import time
 import datetime
 import os
+import cProfile
+import base64
+import gzip
+import json
+import zlib
+import math
+import contextlib
+import itertools
+import queue
+import threading
 
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from flask import Flask, jsonify, request
-from datetime import datetime, timedelta
+
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request, stream_with_context
+from datetime import datetime, timedelta, timezone
 
 from rich import print
 from dotenv import load_dotenv
 
+from cache import TTLCache
+from categories import load_category_rules
+from columnar import EventBatch
+from aw_client import ActivityWatchUnavailable
+from afk import active_totals, merge_intervals
+from archive import SegmentArchive
+from event_store import EventStore
+from leader import LeaderLock
+from metrics import EVENTS_PER_REQUEST, PHASE_SECONDS, REGISTRY, REQUEST_SECONDS, Gauge, time_iter
+from push import StatsBroadcaster, summarize_stats
+from timeline import SessionTracker, build_sessions, interval_metrics
+from scheduler import IngestScheduler
+from sources import load_sources
+from stats import (
+    DURATION_UNIT_SCALES, UNIT_SAMPLE_SIZE, detect_duration_unit, event_intervals, get_window_stats_from_totals
+)
+import timestamps
+
 load_dotenv()
 
 if os.getenv("DEBUG") == "True":
@@ -24,426 +52,950 @@ else:
     BUCKET_ID = "aw-watcher-window_LAPTOP-PFKAKGVO"
     INTERVAL = 120  # 间隔秒数
 
-# Flask应用配置
-app = Flask(__name__)
-app.config['JSON_AS_ASCII'] = False  # 支持中文显示
+# 本地事件存储配置
+EVENT_DB_PATH = os.getenv("EVENT_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "aw_events.db"))
+MAX_WINDOW_HOURS = 168  # 页面最大时间范围（7天），首次同步回填这么久的数据
+SYNC_OVERLAP = 300  # 增量同步时向前重叠的秒数，用于取回心跳合并后变长的最后一个事件
+FETCH_PAGE_SIZE = 5000  # 每次向 ActivityWatch 请求的最大事件数
+SYNC_BATCH_SIZE = 1000  # 同步时每批写入本地存储的事件数
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "10"))  # 页面/API 结果缓存秒数
+SOURCE_TIMEOUT = int(os.getenv("SOURCE_TIMEOUT", "30"))  # 一轮同步中等待每个数据源的最长秒数
+SYNC_IDLE_INTERVAL = INTERVAL * 8  # 数据源没有新活动时同步间隔逐次加倍的上限
+SYNC_JITTER = 0.1  # 同步间隔的随机抖动比例
 
-def fetch_recent_window_events():
-    """获取最近的窗口事件数据"""
-    url = f"{BASE_URL}/buckets/{BUCKET_ID}/events"
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        events = resp.json()
-        print(f"[{datetime.now()}] 最近1小时窗口事件数: {len(events)}")
-        return events
-    except requests.exceptions.ConnectionError:
-        print(f"[{datetime.now()}] ActivityWatch服务未运行，无法获取数据。")
-        pass
-    except requests.exceptions.Timeout:
-        print(f"[{datetime.now()}] 请求超时，无法获取数据。")
-        pass
-    except Exception as e:
-        print(f"[{datetime.now()}] 获取数据出错: {e}")
-        pass
-    return []
-
-def fetch_window_events_by_timerange(hours=1):
-    """根据时间范围获取窗口事件数据"""
-    from datetime import timezone
-    
-    # 使用UTC时间，因为ActivityWatch内部使用UTC
-    end_time = datetime.now(timezone.utc)
-    start_time = end_time - timedelta(hours=hours)
-    
-    # 转换为ISO格式，ActivityWatch API需要的格式
-    start_iso = start_time.isoformat()
-    end_iso = end_time.isoformat()
-    
-    url = f"{BASE_URL}/buckets/{BUCKET_ID}/events"
-    params = {
-        'start': start_iso,
-        'end': end_iso
-    }
-    
-    try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        events = resp.json()
-        print(f"[DEBUG] 请求时间范围: {start_iso} 到 {end_iso}")
-        print(f"[DEBUG] 获取到 {len(events)} 个事件")
-        return events
-    except requests.exceptions.ConnectionError:
-        # ActivityWatch服务未运行时静默处理
-        return []
-    except requests.exceptions.Timeout:
-        # 请求超时时静默处理
-        return []
-    except Exception:
-        # 其他错误也静默处理
-        return []
+# 历史归档：已经结束的天压缩成按天的列式分段文件，超过保留期的原始事件只保留在归档中，
+# 更早的预聚合降采样为每小时一个桶；保留天数设为 0 时不删除/不降采样
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", EVENT_DB_PATH + ".archive")
+ARCHIVE_DELAY = 86400  # 一天结束后再等这么多秒才归档，心跳合并可能还会延长当天最后的事件
+EVENT_RETENTION_DAYS = int(os.getenv("EVENT_RETENTION_DAYS", "30"))  # SQLite 中保留原始事件的天数
+ROLLUP_RETENTION_DAYS = int(os.getenv("ROLLUP_RETENTION_DAYS", "90"))  # 保留 5 分钟预聚合的天数
+COMPACT_INTERVAL = 3600  # 负责同步的进程检查归档和保留期的间隔秒数
+WRITE_LOG_RETENTION = 86400  # 写入记录保留秒数，更久没有更新专注时段的进程会从头重建
 
-def fetch_window_events_by_timerange_alternative(hours=1):
-    """备用方案：使用本地时间但尝试不同的API调用方式"""
-    end_time = datetime.now()
-    start_time = end_time - timedelta(hours=hours)
-    
-    url = f"{BASE_URL}/buckets/{BUCKET_ID}/events"
+# 活跃时间：同步各数据源的 aw-watcher-afk bucket，统计时可以只计算没有离开电脑的时间
+AFK_AWARE = os.getenv("AFK_AWARE", "True") == "True"
+ACTIVE_TIME_DEFAULT = os.getenv("ACTIVE_TIME_DEFAULT") == "True"  # 页面和 API 默认是否只统计活跃时间
+ACTIVE_SLOT = 3600  # 活跃时间按小时分段计算，已经结束的小时缓存结果
+AFK_STALE_AFTER = max(INTERVAL * 2, 60)  # afk bucket 最新事件结束超过这么多秒时认为 afk watcher 没有运行，调度不参考它
+
+# 多进程部署：同一个数据库只由一个进程向 ActivityWatch 同步，其余进程只读
+# AW_INGEST=auto 时各进程通过文件锁选出一个负责同步，=off 时本进程从不同步（由 ingest.py 单独同步）
+INGEST_MODE = os.getenv("AW_INGEST", "auto")
+LEADER_LOCK_PATH = EVENT_DB_PATH + ".lock"
+FOLLOW_INTERVAL = min(INTERVAL, 5)  # 只读进程检查数据库是否有新写入的间隔秒数
+
+# 数据源：默认只有上面配置的一个 bucket，可通过 AW_SOURCES 配置多台机器、多个 bucket
+SOURCES = load_sources(BASE_URL, BUCKET_ID)
+
+# 分类规则：通过 CATEGORY_RULES / CATEGORY_RULES_FILE 把 (应用, 标题) 归到“工作”“娱乐”等分类
+CATEGORY_CACHE_SIZE = 65536  # 缓存分类结果的 (应用, 标题) 数
+
+# 专注时段：同一应用的相邻事件间隔不超过 FOCUS_GAP 秒时合并为一个时段，应用之间的每次切换开始一个新时段
+FOCUS_GAP = int(os.getenv("FOCUS_GAP", "60"))
+TIMELINE_MAX_INTERVALS = 1000  # /api/timeline 一次最多返回的区间数
+# 增量维护的专注时段范围，比最大时间范围多一小时：请求里算出的 start 早于维护时刻，留出余量后 hours=168 也不用重建
+TIMELINE_HORIZON = (MAX_WINDOW_HOURS + 1) * 3600
+
+# 请求参数支持的时间范围（epoch 秒），超出时返回 400，避免 datetime 换算溢出
+MIN_TIMESTAMP = 0
+MAX_TIMESTAMP = 4102444800  # 2100-01-01T00:00:00Z
+
+event_store = EventStore(EVENT_DB_PATH, archive=SegmentArchive(ARCHIVE_DIR))
+response_cache = TTLCache(maxsize=64, ttl=RESPONSE_CACHE_TTL)
+active_slot_cache = TTLCache(maxsize=4096, ttl=MAX_WINDOW_HOURS * 3600)
+broadcaster = StatsBroadcaster()
+category_rules = load_category_rules(CATEGORY_CACHE_SIZE)
+
+REGISTRY.register(Gauge(
+    'aw_finder_cache_hits_total', '响应缓存命中次数（含合并到进行中加载的请求）',
+    lambda: response_cache.hits, metric_type='counter'
+))
+REGISTRY.register(Gauge(
+    'aw_finder_cache_misses_total', '响应缓存未命中次数',
+    lambda: response_cache.misses, metric_type='counter'
+))
+REGISTRY.register(Gauge(
+    'aw_finder_cache_hit_ratio', '响应缓存命中率',
+    lambda: response_cache.hits / (response_cache.hits + response_cache.misses)
+    if response_cache.hits + response_cache.misses else 0
+))
+REGISTRY.register(Gauge(
+    'aw_finder_category_cache_hits_total', '分类结果缓存命中次数',
+    lambda: category_rules.cache_info().hits, metric_type='counter'
+))
+REGISTRY.register(Gauge(
+    'aw_finder_category_cache_misses_total', '分类结果缓存未命中次数（实际执行规则匹配的次数）',
+    lambda: category_rules.cache_info().misses, metric_type='counter'
+))
+REGISTRY.register(Gauge(
+    'aw_finder_archive_bytes', '历史归档分段文件的总字节数',
+    lambda: event_store.archive.size()
+))
+REGISTRY.register(Gauge(
+    'aw_finder_source_up', '数据源最近一次同步是否成功',
+    lambda: {(('source', name),): int(status['ok']) for name, status in last_sync['sources'].items()}
+))
+sync_executor = ThreadPoolExecutor(max_workers=min(32, len(SOURCES)), thread_name_prefix='aw-sync')
+last_sync = {'time': None, 'ok': False, 'sources': {}}
+last_compaction = {'time': None}
+sync_lock = threading.Lock()
+source_locks = {source.name: threading.Lock() for source in SOURCES}
+
+# 页面可选的时间范围：1小时, 6小时, 1天, 3天, 7天
+TIME_LABELS = {1: "1小时", 6: "6小时", 24: "1天", 72: "3天", 168: "7天"}
+TIME_OPTIONS = [(1, "📊", "1小时"), (6, "⏰", "6小时"), (24, "📅", "1天"), (72, "📈", "3天"), (168, "📆", "7天")]
+INDEX_STREAM_BUFFER = 20  # 流式渲染时每次发送的模板片段数
+API_PAGE_SIZE = 1000  # /api/events 分页时的默认每页事件数
+API_MAX_PAGE_SIZE = 5000  # /api/events 每页事件数上限
+GZIP_MIN_SIZE = 1024  # 超过这个字节数的 JSON 响应才压缩
+STREAM_KEEPALIVE = 15  # 推送连接空闲时发送心跳的间隔秒数
+STREAM_RETRY_MS = 5000  # 推送连接断开后浏览器重连的等待毫秒数
+# 每个进程同时保持的推送连接数上限：每个连接一直占用一个线程，超过时返回 503，保证普通请求还有线程可用
+# gunicorn 下默认取每个工作进程线程数的一半（见 gunicorn.conf.py）
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "4"))
+stream_slots = threading.BoundedSemaphore(STREAM_MAX_CLIENTS)
+
+# 各数据源最近 MAX_WINDOW_HOURS 小时的专注时段，后台同步后增量更新，页面的每个时间范围一个滑动窗口
+timeline_trackers = {
+    source.name: SessionTracker(FOCUS_GAP, TIMELINE_HORIZON, [hours * 3600 for hours in TIME_LABELS])
+    for source in SOURCES
+}
+
+# 性能剖析：PROFILE_REQUESTS=True 时为每个请求保存一份 cProfile 结果到 PROFILE_DIR
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS") == "True"
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+profile_lock = threading.Lock()
+
+leader_lock = LeaderLock(LEADER_LOCK_PATH)
+ingest_state = {'role': None}  # 'leader'：本进程负责同步；'follower'：读取其他进程写入的数据
+
+# 页面和接口，由 create_app 注册到应用上
+bp = Blueprint('aw_finder', __name__)
+
+def iter_window_events_between(source, start_time, end_time=None, page_size=FETCH_PAGE_SIZE, bucket=None):
+    """按时间范围分页获取窗口事件，由 ActivityWatch 在服务端筛选，边下载边逐个产出事件
+
+    ActivityWatch 按时间倒序返回事件，每页满 page_size 条时以本页最早事件的时间作为
+    下一页的 end 继续请求，越过 start_time 或不满一页时停止。
+    服务不可用时抛出 ActivityWatchUnavailable，时间段内没有事件时不产出任何事件。
+    bucket 默认为数据源的窗口 bucket，也用于获取同一主机的 afk bucket。
+    """
+    start_time = timestamps.to_utc(start_time)
+    end_time = timestamps.to_utc(end_time) if end_time is not None else datetime.now(timezone.utc)
+    path = f"/buckets/{bucket or source.bucket}/events"
     
-    # 尝试方案1：不使用时间参数，获取所有数据然后在本地筛选
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        all_events = resp.json()
-        
-        # 在本地筛选符合时间范围的事件
-        filtered_events = []
-        parse_errors = 0
-        time_range_debug = []
-        
-        for event in all_events:
-            # ActivityWatch事件的时间戳格式可能是字符串
-            event_time_str = event.get('timestamp')
-            if event_time_str:
-                try:
-                    # 使用安全的时间解析函数
-                    event_time = parse_timestamp_safe(event_time_str)
-                    if event_time is None:
-                        continue
-                    
-                    # 转换为本地时间进行比较
-                    if hasattr(event_time, 'tzinfo') and event_time.tzinfo:
-                        event_time_local = event_time.astimezone()
-                    else:
-                        event_time_local = event_time
-                    
-                    # 移除时区信息以便比较
-                    event_time_naive = event_time_local.replace(tzinfo=None)
-                    
-                    # 检查事件是否在时间范围内
-                    if start_time <= event_time_naive <= end_time:
-                        filtered_events.append(event)
-                    
-                    # 收集调试信息（只收集前5个）
-                    if len(time_range_debug) < 5:
-                        time_range_debug.append({
-                            'original': event_time_str,
-                            'parsed': event_time.isoformat() if event_time else 'None',
-                            'local_naive': event_time_naive.isoformat(),
-                            'in_range': start_time <= event_time_naive <= end_time
-                        })
-                    
-                except Exception as e:
-                    parse_errors += 1
-                    if parse_errors <= 3:  # 只打印前3个错误
-                        print(f"[DEBUG] 时间解析错误: {event_time_str} -> {e}")
+    seen_ids = set()
+    page_end = end_time
+    while True:
+        params = {
+            'start': start_time.isoformat(),
+            'end': page_end.isoformat(),
+            'limit': page_size
+        }
+        page_count = 0
+        new_count = 0
+        last_event = None
+        for event in source.client.iter_json(path, params=params):
+            page_count += 1
+            last_event = event
+            event_id = event.get('id')
+            if event_id is not None:
+                if event_id in seen_ids:
                     continue
+                seen_ids.add(event_id)
+            new_count += 1
+            yield event
         
-        print(f"[DEBUG] 备用方案详情:")
-        print(f"  - 目标时间范围: {start_time} 到 {end_time}")
-        print(f"  - 解析错误数: {parse_errors}")
-        print(f"  - 筛选结果: 从 {len(all_events)} 个事件中筛选出 {len(filtered_events)} 个")
-        
-        # 打印一些时间范围调试信息
-        for debug_item in time_range_debug:
-            print(f"  - 时间样本: {debug_item}")
-        
-        return filtered_events
+        if page_count < page_size or not new_count:
+            break
         
-    except Exception as e:
-        print(f"[DEBUG] 备用方案异常: {e}")
-        return []
+        oldest = timestamps.parse(last_event.get('timestamp'))
+        if oldest is None or oldest <= start_time:
+            break
+        # 下一页从本页最早事件开始（含），重复的事件按 id 去重
+        page_end = oldest
 
-def fetch_window_events_by_timerange_smart(hours=1):
-    """智能获取窗口事件：先尝试UTC时间，失败后尝试备用方案"""
-    # 首先尝试UTC时间方案
-    events = fetch_window_events_by_timerange(hours)
-    
-    # 如果没有获取到数据，尝试备用方案
-    if not events:
-        print(f"[DEBUG] UTC时间方案无数据，尝试备用方案...")
-        events = fetch_window_events_by_timerange_alternative(hours)
+def get_source(name=None):
+    """按名称查找数据源，不指定名称时返回第一个数据源"""
+    if name is None:
+        return SOURCES[0]
+    for source in SOURCES:
+        if source.name == name:
+            return source
+    raise KeyError(f"未知的数据源: {name}")
+
+def sync_source(source):
+    """增量同步单个数据源：只请求本地最新事件之后（含少量重叠）的数据并写入本地存储"""
+    lock = source_locks[source.name]
+    if not lock.acquire(blocking=False):
+        # 上一轮对这个数据源的同步还没结束（例如主机响应很慢），本轮跳过
+        return 0
+    try:
+        # ActivityWatch 按时间倒序返回，中途失败时已写入的是较新的事件，
+        # 所以同步进度只在完整同步后才推进，而不是直接取本地最新事件
+        latest = event_store.synced_until(source.key)
+        if latest is None:
+            start_time = datetime.now(timezone.utc) - timedelta(hours=MAX_WINDOW_HOURS)
+        else:
+            start_time = timestamps.from_epoch(latest - SYNC_OVERLAP)
+
+        status = {'time': time.time(), 'ok': False, 'error': None}
+        count = 0
+        try:
+            # 写入时统一换算成秒，统计时不再需要检测和换算单位
+            scale = DURATION_UNIT_SCALES[resolve_duration_unit(source)]
+            # 分批写入，内存占用不随同步的事件数增长
+            for batch in itertools.batched(iter_window_events_between(source, start_time), SYNC_BATCH_SIZE):
+                count += event_store.upsert_events(source.key, batch, scale)
+        except ActivityWatchUnavailable as e:
+            status['error'] = str(e)
+            set_source_status(source, status)
+            print(f"[{datetime.now()}] 数据源 {source.name}: {e}，无法获取数据。")
+            return count
+        status['ok'] = True
+        event_store.mark_synced(source.key)
+        set_source_status(source, status)
+
+        print(f"[{datetime.now()}] 数据源 {source.name}: 增量同步窗口事件数: {count}")
+        if AFK_AWARE and source.afk_bucket:
+            sync_afk_bucket(source)
+        return count
+    finally:
+        lock.release()
+
+def sync_afk_bucket(source):
+    """增量同步数据源所在主机的 afk bucket（不写预聚合），失败时只打印，不影响窗口数据和在线状态"""
+    latest = event_store.synced_until(source.afk_key)
+    if latest is None:
+        start_time = datetime.now(timezone.utc) - timedelta(hours=MAX_WINDOW_HOURS)
+    else:
+        start_time = timestamps.from_epoch(latest - SYNC_OVERLAP)
     
-    return events
+    count = 0
+    try:
+        # aw-watcher-afk 是官方 watcher，时长以秒为单位
+        events = iter_window_events_between(source, start_time, bucket=source.afk_bucket)
+        for batch in itertools.batched(events, SYNC_BATCH_SIZE):
+            count += event_store.upsert_events(source.afk_key, batch, rollup=False)
+    except ActivityWatchUnavailable as e:
+        print(f"[{datetime.now()}] 数据源 {source.name}: 无法获取 afk 数据（{e}），活跃时间暂不可用。")
+        return count
+    event_store.mark_synced(source.afk_key)
+    return count
+
+def sync_event_store():
+    """并发同步所有数据源，整轮耗时受最慢的数据源（最多 SOURCE_TIMEOUT 秒）限制，而不是所有数据源之和
+
+    同步结束后把各时间窗口的统计变化推送给订阅的页面。
+    """
+    count = sync_all_sources()
+    publish_stats_updates()
+    return count
+
+def sync_all_sources():
+    with sync_lock:
+        futures = {sync_executor.submit(sync_source, source): source for source in SOURCES}
+        done, not_done = wait(futures, timeout=SOURCE_TIMEOUT)
+        for future in not_done:
+            source = futures[future]
+            set_source_status(source, {'time': time.time(), 'ok': False, 'error': '同步超时'})
+            print(f"[{datetime.now()}] 数据源 {source.name}: 同步超过 {SOURCE_TIMEOUT} 秒，本轮不再等待。")
+
+        count = 0
+        for future in done:
+            source = futures[future]
+            if future.exception() is not None:
+                set_source_status(source, {'time': time.time(), 'ok': False, 'error': str(future.exception())})
+                print(f"[{datetime.now()}] 数据源 {source.name}: 同步出错: {future.exception()}")
+            else:
+                count += future.result()
+
+        refresh_sync_status()
+        return count
 
-def get_window_stats(events):
-    """分析窗口使用统计"""
+def set_source_status(source, status):
+    """记录数据源最近一次同步的结果，同时写入本地存储，供其他只读进程显示在线状态"""
+    last_sync['sources'][source.name] = status
+    event_store.record_sync_status(source.key, status['time'], status['ok'], status['error'])
+
+def load_sync_status():
+    """只读进程从本地存储读取同步进程记录的各数据源状态"""
+    statuses = event_store.sync_statuses()
+    for source in SOURCES:
+        if source.key in statuses:
+            last_sync['sources'][source.name] = statuses[source.key]
+    if last_sync['sources']:
+        refresh_sync_status()
+
+def refresh_sync_status():
+    """根据各数据源最近一次同步结果更新整体状态：任一数据源在线即视为在线"""
+    last_sync['time'] = time.time()
+    last_sync['ok'] = any(status['ok'] for status in last_sync['sources'].values())
+
+def ingest_source(source):
+    """调度器执行的同步任务：同步一个数据源，返回用户是否在活动（决定下次同步的间隔）"""
+    before = event_store.latest_event(source.key)
+    sync_source(source)
+    refresh_sync_status()
+    update_timeline(source)
+    return source_active(source, before)
+
+def source_active(source, before):
+    """同步后判断用户是否在活动
+
+    窗口 watcher 只要开机就一直发心跳，最新事件的结束时间几乎总在推进，不能作为活动信号。
+    有最近的 afk 数据时以最新状态是否为 not-afk 为准；afk watcher 没有运行或数据过旧时，
+    看是否出现了新的窗口事件（心跳只延长同一 (应用, 标题) 的事件，切换窗口才会开始新事件）。
+    """
+    if AFK_AWARE and source.afk_key:
+        afk = event_store.latest_event(source.afk_key)
+        if afk is not None and afk[1] >= time.time() - AFK_STALE_AFTER:
+            return afk[2].get('status') == 'not-afk'
+    after = event_store.latest_event(source.key)
+    return after is not None and (before is None or after[0] > before[0])
+
+def update_timeline(source):
+    """用上次更新之后的新事件增量更新数据源的专注时段（只重新读取当前时段开始以来的事件）
+
+    同步中途（只读进程、请求触发的刷新）或同步失败后才写入的更早事件由写入记录发现，发现后从头重建。
+    """
+    version = event_store.version
+    timeline_trackers[source.name].update(
+        lambda frontier: [
+            interval for interval in event_store.query_intervals(source.key, frontier, math.inf)
+            if interval[0] >= frontier
+        ],
+        time.time(),
+        version,
+        lambda seq: event_store.changed_since(source.key, seq)
+    )
+
+def refresh_timelines():
+    """本地存储有新数据而专注时段还没更新时补一次（只读进程、没有运行调度器时）"""
+    version = event_store.version
+    for source in SOURCES:
+        if timeline_trackers[source.name].version != version:
+            update_timeline(source)
+
+def timeline_summary(hours):
+    """最近 hours 小时（TIME_LABELS 之一）的切换次数、切换频率和最长专注时段，直接读各数据源的滑动窗口"""
+    refresh_timelines()
+    now = time.time()
+    summary = {'switches': 0, 'switch_rate': 0, 'longest_focus': 0.0, 'longest_app': None, 'longest_source': None}
+    for source in SOURCES:
+        switches, longest, session = timeline_trackers[source.name].summary(hours * 3600, now)
+        summary['switches'] += switches
+        if session is not None and longest > summary['longest_focus']:
+            summary.update(longest_focus=longest, longest_app=session.app, longest_source=source.name)
+    summary['switch_rate'] = round(summary['switches'] / hours, 2)
+    return summary
+
+def current_session():
+    """各数据源中最近的一个专注时段（可能仍在继续）"""
+    latest = None
+    for source in SOURCES:
+        session = timeline_trackers[source.name].current
+        if session is not None and (latest is None or session.end > latest[1].end):
+            latest = (source.name, session)
+    if latest is None:
+        return None
+    name, session = latest
+    return {'source': name, 'app': session.app, 'start': timestamps.to_iso(session.start),
+            'end': timestamps.to_iso(session.end), 'duration': session.duration}
+
+def publish_stats_updates():
+    """为每个有页面订阅的时间窗口计算一次统计并推送增量，所有订阅者共享这一次计算"""
+    for hours, active in broadcaster.windows():
+        try:
+            stats = cached_stats(hours, active)
+        except Exception as e:
+            print(f"[{datetime.now()}] 推送统计出错: {e}")
+            continue
+        broadcaster.publish((hours, active), stats)
+
+def after_ingest():
+    """调度器每轮同步后：推送统计，并定期归档、清理历史"""
+    publish_stats_updates()
+    if last_compaction['time'] is None or time.time() - last_compaction['time'] > COMPACT_INTERVAL:
+        last_compaction['time'] = time.time()
+        try:
+            compact_history()
+        except Exception as e:
+            print(f"[{datetime.now()}] 归档历史数据出错: {e}")
+
+def compact_history():
+    """把完整同步过的、已经结束的天归档，然后按保留期删除原始事件、降采样预聚合
+
+    只处理窗口 bucket；afk bucket 的事件很少，一直保留在 SQLite 中。
+    """
+    now = time.time()
+    untils = {
+        source.key: event_store.synced_until(source.key) - ARCHIVE_DELAY
+        for source in SOURCES if event_store.synced_until(source.key) is not None
+    }
+    count = event_store.archive_days(untils)
+    for key in untils:
+        event_store.apply_retention(
+            key,
+            raw_before=now - EVENT_RETENTION_DAYS * 86400 if EVENT_RETENTION_DAYS else None,
+            downsample_before=now - ROLLUP_RETENTION_DAYS * 86400 if ROLLUP_RETENTION_DAYS else None,
+        )
+    event_store.prune_write_log(now - WRITE_LOG_RETENTION)
+    if count:
+        print(f"[{datetime.now()}] 归档历史事件数: {count}")
+    return count
+
+def ensure_store_fresh():
+    """调度器未运行且没有其他进程负责同步（例如被其他方式导入）时，在请求中补一次同步"""
+    if ingest_scheduler.running or ingest_state['role'] == 'follower':
+        return
+    if last_sync['time'] is None or time.time() - last_sync['time'] > INTERVAL * 2:
+        sync_event_store()
+
+def query_events_page(start_ts, end_ts, limit, after=None):
+    """分页读取所有数据源的窗口事件，返回 (事件列表, 下一页位置)，参见 EventStore.query_events_page"""
+    source_names = {source.key: source.name for source in SOURCES}
+    with PHASE_SECONDS.time(phase='filter'):
+        rows, next_after = event_store.query_events_page(list(source_names), start_ts, end_ts, limit, after)
+    events = []
+    for bucket, event in rows:
+        event['source'] = source_names[bucket]
+        events.append(event)
+    return events, next_after
+
+def events_retained_from():
+    """原始事件仍完整保留在 SQLite 中的起点（各数据源 retained_from 的最大值），没有删除过时返回 None
+
+    更早的事件只在归档中保留了统计需要的列（没有事件 id 和 data），只能用于统计，不能按原样返回。
+    """
+    values = [event_store.retained_from(source.key) for source in SOURCES]
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+def get_window_stats(events, duration_unit=None):
+    """分析窗口使用统计，events 可以是事件 dict 列表或列式的 EventBatch
+
+    已知时长单位时（例如来自 bucket 元数据）传入 duration_unit，跳过检测。
+    """
     if not events:
         return {}
     
-    app_usage = {}
-    total_duration = 0
-    
-    # 首先分析duration的单位
-    duration_unit = detect_duration_unit(events)
+    with PHASE_SECONDS.time(phase='aggregate'):
+        batch = events if isinstance(events, EventBatch) else EventBatch.from_events(events)
+        
+        if duration_unit is None:
+            duration_unit = detect_duration_unit(batch)
+        
+        # 按 (应用, 标题) 编码分组求和，再汇总为每个应用的统计
+        return get_window_stats_from_totals(batch.app_title_totals(), duration_unit, category_rules)
+
+def query_window_stats(hours=1, active=False):
+    """从本地预聚合桶计算所有数据源最近 hours 小时的合并统计"""
+    end_ts = time.time()
+    return query_range_stats(end_ts - hours * 3600, end_ts, active)
+
+def query_range_stats(start_ts, end_ts, active=False):
+    """从本地预聚合桶计算所有数据源在 [start_ts, end_ts] 内的合并统计，并附带每个数据源的分项
+
+    active=True 时排除离开电脑的时间（需要已同步数据源的 afk bucket，没有的数据源仍按窗口时长统计）。
+    """
+    ensure_store_fresh()
+    with PHASE_SECONDS.time(phase='aggregate'):
+        return _query_range_stats(start_ts, end_ts, active)
+
+def query_active_totals(source, start_ts, end_ts):
+    """计算数据源在 [start_ts, end_ts) 内排除离开时间后的 (app, title, 活跃时长, 事件数)
+
+    按整点小时分段，窗口 bucket 和 afk bucket 都已完整同步过的小时不会再变化（只有最新的事件会因
+    心跳合并变长），结果缓存下来；窗口两端不足一小时的部分和尚未结束的小时每次重新计算。
+    """
+    closed_until = min(event_store.synced_until(source.key) or 0, event_store.synced_until(source.afk_key) or 0)
+    lo = math.ceil(start_ts / ACTIVE_SLOT) * ACTIVE_SLOT
+    hi = min(math.floor(end_ts / ACTIVE_SLOT), math.floor(closed_until / ACTIVE_SLOT)) * ACTIVE_SLOT
+    if hi <= lo:
+        return compute_active_totals(source, start_ts, end_ts)
     
-    for event in events:
-        data = event.get('data', {})
-        app_name = data.get('app', 'Unknown')
-        title = data.get('title', 'Unknown')
-        raw_duration = event.get('duration', 0)
+    rows = compute_active_totals(source, start_ts, lo)
+    for slot in range(lo, hi, ACTIVE_SLOT):
+        rows.extend(active_slot_cache.get_or_load(
+            (source.key, slot), lambda slot=slot: compute_active_totals(source, slot, slot + ACTIVE_SLOT)
+        ))
+    rows.extend(compute_active_totals(source, hi, end_ts))
+    return rows
+
+def compute_active_totals(source, start_ts, end_ts, active=None):
+    """active 为 None 时从 afk bucket 读取活跃区间；传入 [[start_ts, end_ts]] 时不排除任何时间，只按范围截取时长"""
+    if end_ts <= start_ts:
+        return []
+    window_events = event_store.query_intervals(source.key, start_ts, end_ts)
+    if active is None:
+        active = merge_intervals(event_store.query_status_intervals(source.afk_key, start_ts, end_ts))
+    return active_totals(window_events, active, start_ts, end_ts)
+
+def afk_covered_until(source):
+    """afk 数据覆盖到的时间（afk bucket 最新事件的结束时间）；没有同步过 afk 数据时返回 None
+
+    afk watcher 停止或 afk bucket 同步失败时，这个时间会落后于窗口数据。
+    """
+    if source.afk_key is None or event_store.synced_until(source.afk_key) is None:
+        return None
+    latest = event_store.latest_event(source.afk_key)
+    return latest[1] if latest is not None else None
+
+def _query_range_stats(start_ts, end_ts, active=False):
+    rows = []
+    source_stats = {}
+    app_sources = {}
+    for source in SOURCES:
+        # 本地存储的时长已在写入时换算成秒，这里只报告数据源的原始单位
+        duration_unit = event_store.duration_unit(source.key) or 'seconds'
         
-        # 转换duration为秒
-        duration_seconds = convert_duration_to_seconds(raw_duration, duration_unit)
+        afk_until = afk_covered_until(source) if active else None
+        afk_filtered = afk_until is not None and afk_until > start_ts
+        if afk_filtered:
+            totals = query_active_totals(source, start_ts, min(end_ts, afk_until))
+            if afk_until < end_ts:
+                # afk 数据之后的窗口时间无法判断是否离开电脑，按未排除计入，而不是当作全部离开
+                totals.extend(compute_active_totals(source, afk_until, end_ts, [[afk_until, end_ts]]))
+        else:
+            totals = event_store.query_app_title_totals(source.key, start_ts, end_ts)
         
-        if app_name not in app_usage:
-            app_usage[app_name] = {
-                'total_duration': 0,
-                'count': 0,
-                'titles': set()
-            }
+        source_duration = 0
+        source_events = 0
+        for app_name, title, duration_seconds, count in totals:
+            rows.append((app_name, title, duration_seconds, count))
+            per_app = app_sources.setdefault(app_name, {})
+            per_app[source.name] = per_app.get(source.name, 0) + duration_seconds
+            source_duration += duration_seconds
+            source_events += count
         
-        app_usage[app_name]['total_duration'] += duration_seconds
-        app_usage[app_name]['count'] += 1
-        app_usage[app_name]['titles'].add(title)
-        total_duration += duration_seconds
-    
-    # 转换为可序列化的格式
-    for app in app_usage:
-        app_usage[app]['titles'] = list(app_usage[app]['titles'])
-        app_usage[app]['percentage'] = round((app_usage[app]['total_duration'] / total_duration * 100), 2) if total_duration > 0 else 0
-    
-    return {
-        'total_events': len(events),
-        'total_duration': total_duration,  # 现在是秒为单位
-        'duration_unit': duration_unit,
-        'app_usage': app_usage
-    }
+        source_stats[source.name] = {
+            'total_events': source_events,
+            'total_duration': source_duration,
+            'duration_unit': duration_unit,
+            'online': last_sync['sources'].get(source.name, {}).get('ok', False),
+            'afk_filtered': afk_filtered
+        }
+        if afk_filtered:
+            # 只有这个时间之前的部分排除了离开时间
+            source_stats[source.name]['afk_filtered_until'] = timestamps.to_iso(min(end_ts, afk_until))
+    
+    stats = get_window_stats_from_totals(rows, 'seconds', category_rules)
+    if not stats:
+        return {}
+    
+    units = {item['duration_unit'] for item in source_stats.values() if item['total_events']}
+    stats['duration_unit'] = units.pop() if len(units) == 1 else 'mixed'
+    stats['sources'] = source_stats
+    stats['active_only'] = active
+    for app_name, data in stats['app_usage'].items():
+        data['sources'] = app_sources[app_name]
+    return stats
 
-def detect_duration_unit(events):
-    """检测事件持续时间的单位"""
-    if not events:
-        return 'seconds'
-    
-    # 取样本事件分析
-    sample_size = min(10, len(events))
-    total_duration = sum(event.get('duration', 0) for event in events[:sample_size])
-    avg_duration = total_duration / sample_size if sample_size > 0 else 0
-    
-    # 根据平均持续时间判断单位
-    if avg_duration < 100:  # 可能是秒
-        return 'seconds'
-    elif avg_duration < 100000:  # 可能是毫秒
-        return 'milliseconds'
-    else:  # 可能是微秒或纳秒
-        return 'microseconds'
-
-def convert_duration_to_seconds(duration, unit):
-    """将持续时间转换为秒"""
-    if unit == 'seconds':
-        return duration
-    elif unit == 'milliseconds':
-        return duration / 1000
-    elif unit == 'microseconds':
-        return duration / 1000000
+def cached_query(kind, window, loader):
+    """按 (类型, 时间窗口, 数据版本) 缓存查询结果，并发的相同请求只查询一次
+
+    window 是 hours（相对当前时间的窗口）或 (start_ts, end_ts)。
+    """
+    ensure_store_fresh()
+    key = (kind, window, event_store.version)
+    return response_cache.get_or_load(key, loader)
+
+def cached_stats(hours, active=False):
+    """最近 hours 小时的统计（页面、推送共用的缓存）"""
+    return cached_query('active_stats' if active else 'stats', hours, lambda: query_window_stats(hours, active))
+
+def parse_active(args):
+    """解析 active 参数：是否排除离开电脑的时间"""
+    value = args.get('active')
+    if value is None:
+        return ACTIVE_TIME_DEFAULT
+    return value.lower() in ('1', 'true', 'yes')
+
+def resolve_duration_unit(source):
+    """获取数据源的时长单位：每个 bucket 只检测一次，结果记录在本地存储的 bucket 元数据中
+
+    ActivityWatch 官方 watcher 的 duration 按文档以秒为单位，直接采用；
+    其他客户端写入的 bucket 取最新 UNIT_SAMPLE_SIZE 个事件的中位数推断。
+    """
+    unit = event_store.duration_unit(source.key)
+    if unit is not None:
+        return unit
+    
+    metadata = source.client.get_json(f"/buckets/{source.bucket}")
+    if str(metadata.get('client', '')).startswith('aw-'):
+        unit = 'seconds'
     else:
-        # 默认假设是秒
-        return duration
+        unit = detect_duration_unit(fetch_sample_events(source, UNIT_SAMPLE_SIZE))
+    
+    event_store.set_duration_unit(source.key, unit, DURATION_UNIT_SCALES[unit])
+    print(f"[{datetime.now()}] 数据源 {source.name}: 时长单位为 {unit}")
+    return unit
 
-@app.route('/')
+@bp.route('/')
 def index():
     """主页面，显示使用统计概览"""
     # 获取时间范围参数，默认1小时
     hours = request.args.get('hours', 1, type=int)
     
     # 限制时间范围在合理区间内
-    if hours not in [1, 6, 24, 72, 168]:  # 1小时, 6小时, 1天, 3天, 7天
+    if hours not in TIME_LABELS:
         hours = 1
     
-    events = fetch_window_events_by_timerange_smart(hours)
-    stats = get_window_stats(events)
+    active = parse_active(request.args)
+    stats = cached_stats(hours, active)
     
-    # 根据时间范围显示不同的标题
-    time_labels = {
-        1: "1小时",
-        6: "6小时", 
-        24: "1天",
-        72: "3天",
-        168: "7天"
-    }
+    # 按使用时长排序，应用列表以迭代器交给模板，页头和概览先发送，应用列表边渲染边发送
+    app_usage = stats.get('app_usage', {}) if stats else {}
+    apps = iter(sorted(app_usage.items(), key=lambda x: x[1]['total_duration'], reverse=True))
+    # 没有配置分类规则时所有时间都是未分类，不显示分类
+    category_usage = stats.get('category_usage', {}) if stats and category_rules.rules else {}
+    categories = sorted(category_usage.items(), key=lambda x: x[1]['total_duration'], reverse=True)
     
-    current_time_label = time_labels.get(hours, f"{hours}小时")
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>窗口使用情况统计 - {current_time_label}</title>
-        <meta charset="utf-8">
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
-            .container {{ max-width: 1200px; margin: 0 auto; background: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-            .header {{ text-align: center; margin-bottom: 30px; }}
-            .time-filter {{ text-align: center; margin-bottom: 20px; }}
-            .time-btn {{ display: inline-block; margin: 0 5px; padding: 8px 16px; background: #f8f9fa; border: 1px solid #ddd; border-radius: 20px; text-decoration: none; color: #333; transition: all 0.3s; }}
-            .time-btn:hover {{ background: #e9ecef; }}
-            .time-btn.active {{ background: #007bff; color: white; border-color: #007bff; }}
-            .stats {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 20px; margin-bottom: 30px; }}
-            .stat-card {{ background: #f8f9fa; padding: 15px; border-radius: 5px; border-left: 4px solid #007bff; }}
-            .app-list {{ margin-top: 20px; }}
-            .app-item {{ background: #fff; margin: 10px 0; padding: 15px; border-radius: 5px; border: 1px solid #ddd; }}
-            .app-name {{ font-weight: bold; font-size: 1.1em; color: #333; }}
-            .app-details {{ margin-top: 5px; color: #666; }}
-            .progress-bar {{ background: #e9ecef; height: 20px; border-radius: 10px; margin: 10px 0; }}
-            .progress-fill {{ background: #007bff; height: 100%; border-radius: 10px; transition: width 0.3s ease; }}
-            .no-data {{ text-align: center; padding: 40px; color: #666; background: #f8f9fa; border-radius: 5px; margin: 20px 0; }}
-            .status-indicator {{ display: inline-block; width: 10px; height: 10px; border-radius: 50%; margin-right: 5px; }}
-            .status-online {{ background: #28a745; }}
-            .status-offline {{ background: #dc3545; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🖥️ 窗口使用情况统计</h1>
-                <p>
-                    <span class="status-indicator {'status-online' if events else 'status-offline'}"></span>
-                    {'ActivityWatch 服务运行中' if events else 'ActivityWatch 服务未运行'}
-                    | 最后更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-                </p>
-            </div>
-            
-            <div class="time-filter">
-                <h3>📅 选择时间范围：</h3>
-                <a href="?hours=1" class="time-btn {'active' if hours == 1 else ''}">📊 1小时</a>
-                <a href="?hours=6" class="time-btn {'active' if hours == 6 else ''}">⏰ 6小时</a>
-                <a href="?hours=24" class="time-btn {'active' if hours == 24 else ''}">📅 1天</a>
-                <a href="?hours=72" class="time-btn {'active' if hours == 72 else ''}">📈 3天</a>
-                <a href="?hours=168" class="time-btn {'active' if hours == 168 else ''}">📆 7天</a>
-            </div>
+    stream = current_app.jinja_env.get_template('index.html').stream(
+        hours=hours,
+        active=active,
+        time_label=TIME_LABELS[hours],
+        time_options=TIME_OPTIONS,
+        online=last_sync['ok'],
+        online_sources=sum(1 for status in last_sync['sources'].values() if status['ok']),
+        source_count=len(SOURCES),
+        now=timestamps.format_local(),
+        stats=stats,
+        categories=categories,
+        apps=apps
+    )
+    stream.enable_buffering(INDEX_STREAM_BUFFER)
+    EVENTS_PER_REQUEST.observe(stats.get('total_events', 0) if stats else 0, endpoint='index')
+    return Response(stream_with_context(time_iter(PHASE_SECONDS, stream, phase='render')), mimetype='text/html')
+
+def check_timestamp(ts, name):
+    """时间需要是有限值且在 [MIN_TIMESTAMP, MAX_TIMESTAMP] 内，否则后面的时间换算会溢出"""
+    if not math.isfinite(ts) or not MIN_TIMESTAMP <= ts <= MAX_TIMESTAMP:
+        raise ValueError(f"{name} 超出支持的时间范围")
+    return ts
+
+def parse_time_param(value, name):
+    """解析 start/end 参数：ISO 8601 时间（缺少时区按 UTC）或 epoch 秒"""
+    try:
+        ts = float(value)
+    except ValueError:
+        ts = timestamps.to_epoch(value)
+        if ts is None:
+            raise ValueError(f"无法解析的时间: {value}") from None
+    return check_timestamp(ts, name)
+
+def parse_time_range(args):
+    """解析请求的时间范围，返回 (start_ts, end_ts, hours)
+
+    指定了 start 或 end 时按绝对时间范围处理（hours 为 None，只给 start 时 end 为当前时间）；
+    否则取最近 hours 小时（默认 1 小时，可以是任意正数）。
     """
+    hours = args.get('hours', 1, type=float)
+    if not math.isfinite(hours) or hours <= 0:
+        raise ValueError("hours 必须是大于 0 的有限数")
+    if hours.is_integer():
+        hours = int(hours)
     
-    if not events:
-        html += """
-            <div class="no-data">
-                <h3>🔌 暂无数据</h3>
-                <p>ActivityWatch 服务可能未运行，或者所选时间段内没有窗口活动记录。</p>
-                <p>请确保 ActivityWatch 正在运行，并稍后刷新页面。</p>
-            </div>
-        """
-    else:
-        total_hours = round(stats.get('total_duration', 0) / 3600, 2)
-        total_minutes = round(stats.get('total_duration', 0) / 60, 2)
-        duration_unit = stats.get('duration_unit', 'seconds')
-        
-        html += f"""
-            <div class="stats">
-                <div class="stat-card">
-                    <h3>📊 总事件数</h3>
-                    <h2>{stats.get('total_events', 0)}</h2>
-                </div>
-                <div class="stat-card">
-                    <h3>⏱️ 活跃时长</h3>
-                    <h2>{total_hours} 小时</h2>
-                    <small>({total_minutes} 分钟)</small>
-                </div>
-                <div class="stat-card">
-                    <h3>📱 应用数量</h3>
-                    <h2>{len(stats.get('app_usage', {}))}</h2>
-                </div>
-                <div class="stat-card">
-                    <h3>📋 时间段</h3>
-                    <h2>{current_time_label}</h2>
-                    <small>检测单位: {duration_unit}</small>
-                </div>
-            </div>
-            
-            <div class="app-list">
-                <h2>应用使用详情 (过去{current_time_label})</h2>
-        """
-        
-        # 按使用时长排序
-        app_usage = stats.get('app_usage', {})
-        sorted_apps = sorted(app_usage.items(), key=lambda x: x[1]['total_duration'], reverse=True)
-        
-        if sorted_apps:
-            for app_name, data in sorted_apps:
-                duration_hours = round(data['total_duration'] / 3600, 2)
-                duration_minutes = round(data['total_duration'] / 60, 2)
-                percentage = data['percentage']
-                
-                html += f"""
-                        <div class="app-item">
-                            <div class="app-name">{app_name}</div>
-                            <div class="app-details">
-                                使用时长: {duration_hours} 小时 ({duration_minutes} 分钟) | 占比: {percentage}% | 切换次数: {data['count']}
-                            </div>
-                            <div class="progress-bar">
-                                <div class="progress-fill" style="width: {percentage}%"></div>
-                            </div>
-                            <details>
-                                <summary>窗口标题 ({len(data['titles'])}个)</summary>
-                                <ul>
-                """
-                
-                for title in data['titles'][:15]:  # 显示前15个标题
-                    html += f"<li>{title}</li>"
-                
-                if len(data['titles']) > 15:
-                    html += f"<li>... 还有 {len(data['titles']) - 15} 个标题</li>"
-                
-                html += """
-                                </ul>
-                            </details>
-                        </div>
-                """
-        else:
-            html += """
-                <div class="no-data">
-                    <p>所选时间段内没有应用使用记录</p>
-                </div>
-            """
-        
-        html += "</div>"
-    
-    html += """
-        </div>
-        <script>
-            // 自动刷新页面，但保持当前选择的时间范围
-            setTimeout(() => location.reload(), 30000);
-        </script>
-    </body>
-    </html>
-    """
+    start = args.get('start')
+    end = args.get('end')
+    if start is None and end is None:
+        end_ts = time.time()
+        return check_timestamp(end_ts - hours * 3600, 'hours'), end_ts, hours
     
-    return html
+    end_ts = parse_time_param(end, 'end') if end else time.time()
+    start_ts = parse_time_param(start, 'start') if start else check_timestamp(end_ts - hours * 3600, 'hours')
+    if start_ts > end_ts:
+        raise ValueError("start 不能晚于 end")
+    return start_ts, end_ts, None
+
+def encode_cursor(after):
+    """把分页位置编码为不透明的 cursor 字符串"""
+    if after is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode()
 
-@app.route('/api/events')
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        ts, bucket, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError("无效的 cursor") from e
+    return (ts, bucket, event_id)
+
+def accepts_gzip():
+    return 'gzip' in request.accept_encodings
+
+def json_response(payload):
+    """返回 JSON 响应，客户端支持时对较大的响应体做 gzip 压缩"""
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    headers = {'Vary': 'Accept-Encoding'}
+    if accepts_gzip() and len(body) > GZIP_MIN_SIZE:
+        body = gzip.compress(body, compresslevel=6)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body, mimetype='application/json', headers=headers)
+
+def iter_ndjson_events(start_ts, end_ts, after=None):
+    """按页从本地存储读取事件，逐行产出 NDJSON，内存占用与时间范围大小无关"""
+    while True:
+        events, after = query_events_page(start_ts, end_ts, API_PAGE_SIZE, after)
+        if events:
+            yield ''.join(json.dumps(event, ensure_ascii=False) + '\n' for event in events).encode('utf-8')
+        if after is None:
+            return
+
+def iter_gzip(chunks):
+    """把字节块流式压缩为 gzip"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@bp.route('/api/events')
 def api_events():
-    """API接口：获取原始事件数据"""
-    hours = request.args.get('hours', 1, type=int)
-    if hours not in [1, 6, 24, 72, 168]:
-        hours = 1
+    """API接口：获取原始事件数据
+
+    时间范围用 hours（最近若干小时，默认1）或 start/end（ISO 8601 或 epoch 秒）指定。
+    总是按页返回：每页 limit 个（默认 API_PAGE_SIZE，最多 API_MAX_PAGE_SIZE），用 next_cursor 取下一页，
+    最后一页的 next_cursor 为 null；format=ndjson 时流式返回整个范围，每行一个事件。客户端支持时响应使用 gzip 压缩。
+    原始事件超过保留期后已删除：范围的开始早于保留起点时截到保留起点，并在响应中给出 retained_from
+    （ndjson 为 X-Retained-From 头）；整个范围都已超过保留期时返回 410。
+    """
+    try:
+        start_ts, end_ts, hours = parse_time_range(request.args)
+        limit = request.args.get('limit', type=int)
+        after = decode_cursor(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    events = fetch_window_events_by_timerange_smart(hours)
-    return jsonify({
+    retained_from = events_retained_from()
+    if retained_from is not None and start_ts < retained_from:
+        if end_ts < retained_from:
+            return jsonify({
+                'success': False,
+                'error': f"{timestamps.to_iso(retained_from)} 之前的原始事件已超过保留期，只能查询统计（/api/stats）",
+                'retained_from': timestamps.to_iso(retained_from)
+            }), 410
+        start_ts = retained_from
+    else:
+        retained_from = None
+    
+    if request.args.get('format') == 'ndjson':
+        ensure_store_fresh()
+        chunks = iter_ndjson_events(start_ts, end_ts, after)
+        headers = {'Vary': 'Accept-Encoding'}
+        if retained_from is not None:
+            headers['X-Retained-From'] = timestamps.to_iso(retained_from)
+        if accepts_gzip():
+            chunks = iter_gzip(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(stream_with_context(chunks), mimetype='application/x-ndjson', headers=headers)
+    
+    payload = {
         'success': True,
-        'data': events,
-        'hours': hours,
-        'timestamp': datetime.now().isoformat()
-    })
+        'start': timestamps.to_iso(start_ts),
+        'end': timestamps.to_iso(end_ts),
+        'timestamp': timestamps.to_iso(time.time())
+    }
+    if hours is not None:
+        payload['hours'] = hours
+    if retained_from is not None:
+        # start 已截到保留起点，更早的部分没有返回
+        payload['retained_from'] = timestamps.to_iso(retained_from)
+    
+    limit = max(1, min(limit or API_PAGE_SIZE, API_MAX_PAGE_SIZE))
+    if after is None and hours is not None:
+        # 最近 hours 小时的第一页请求最多，按窗口缓存
+        payload['data'], after = cached_query('events', (hours, limit), lambda: query_events_page(start_ts, end_ts, limit))
+    else:
+        ensure_store_fresh()
+        payload['data'], after = query_events_page(start_ts, end_ts, limit, after)
+    payload['next_cursor'] = encode_cursor(after)
+    
+    EVENTS_PER_REQUEST.observe(len(payload['data']), endpoint='api_events')
+    return json_response(payload)
 
-@app.route('/api/stats')
+@bp.route('/api/stats')
 def api_stats():
-    """API接口：获取统计数据"""
-    hours = request.args.get('hours', 1, type=int)
-    if hours not in [1, 6, 24, 72, 168]:
-        hours = 1
+    """API接口：获取统计数据，时间范围参数同 /api/events"""
+    try:
+        start_ts, end_ts, hours = parse_time_range(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
-    events = fetch_window_events_by_timerange_smart(hours)
-    stats = get_window_stats(events)
-    return jsonify({
+    window = hours if hours is not None else (start_ts, end_ts)
+    active = parse_active(request.args)
+    stats = cached_query('active_stats' if active else 'stats', window,
+                         lambda: query_range_stats(start_ts, end_ts, active))
+    payload = {
         'success': True,
         'data': stats,
-        'hours': hours,
-        'timestamp': datetime.now().isoformat()
-    })
+        'start': timestamps.to_iso(start_ts),
+        'end': timestamps.to_iso(end_ts),
+        'timestamp': timestamps.to_iso(time.time())
+    }
+    if hours is not None:
+        payload['hours'] = hours
+    EVENTS_PER_REQUEST.observe(stats.get('total_events', 0) if stats else 0, endpoint='api_stats')
+    return json_response(payload)
 
-@app.route('/debug/time')
+@bp.route('/api/timeline')
+def api_timeline():
+    """API接口：专注时段时间线，时间范围参数同 /api/events
+
+    同一应用相邻事件的间隔不超过 FOCUS_GAP 秒时合并为一个专注时段，每次切换应用开始一个新时段。
+    返回时段列表（sessions=0 时省略），以及每 interval 秒一个区间的切换次数、切换频率（次/小时）和
+    最长专注时段（interval=0 时省略，默认按范围长度选 5 分钟或 1 小时）。
+    最近 hours 小时（页面的时间范围之一）的汇总直接读后台增量维护的滑动窗口，适合实时的专注小组件轮询。
+    """
+    try:
+        start_ts, end_ts, hours = parse_time_range(request.args)
+        width = request.args.get('interval', type=float)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if width is None:
+        width = 3600 if end_ts - start_ts > 6 * 3600 else 300
+    if not math.isfinite(width) or width < 0 or (width and (end_ts - start_ts) / width > TIMELINE_MAX_INTERVALS):
+        return jsonify({'success': False, 'error': f"interval 需要大于 0，且区间数不超过 {TIMELINE_MAX_INTERVALS}"}), 400
+    include_sessions = request.args.get('sessions', '1').lower() in ('1', 'true', 'yes')
+    
+    ensure_store_fresh()
+    refresh_timelines()
+    payload = {
+        'success': True,
+        'start': timestamps.to_iso(start_ts),
+        'end': timestamps.to_iso(end_ts),
+        'timestamp': timestamps.to_iso(time.time()),
+        'gap': FOCUS_GAP
+    }
+    data = {'current': current_session()}
+    if hours is not None:
+        payload['hours'] = hours
+    
+    if hours in TIME_LABELS and not include_sessions and not width:
+        # 只要汇总时不读取时段列表，开销与时间范围无关
+        data['summary'] = timeline_summary(hours)
+        payload['data'] = data
+        return json_response(payload)
+    
+    if start_ts >= time.time() - TIMELINE_HORIZON:
+        sources = [
+            (source.name, *timeline_trackers[source.name].sessions_between(start_ts, end_ts)) for source in SOURCES
+        ]
+    else:
+        # 超出增量维护的范围时从本地存储重建
+        sources = [
+            (source.name, build_sessions(event_store.query_intervals(source.key, start_ts, end_ts), FOCUS_GAP), False)
+            for source in SOURCES
+        ]
+    
+    intervals, summary = interval_metrics(sources, start_ts, end_ts, width or (end_ts - start_ts) or 1)
+    summary['switch_rate'] = round(summary['switches'] / ((end_ts - start_ts) / 3600), 2) if end_ts > start_ts else 0
+    data['summary'] = timeline_summary(hours) if hours in TIME_LABELS else summary
+    if width:
+        for interval in intervals:
+            interval['start'] = timestamps.to_iso(interval['start'])
+            interval['end'] = timestamps.to_iso(interval['end'])
+        data['intervals'] = intervals
+    if include_sessions:
+        sessions = sorted(
+            ((name, session) for name, sessions, _ in sources for session in sessions),
+            key=lambda item: item[1].start
+        )
+        data['sessions'] = [
+            {'source': name, 'app': session.app, 'start': timestamps.to_iso(session.start),
+             'end': timestamps.to_iso(session.end), 'duration': session.duration, 'events': session.events}
+            for name, session in sessions
+        ]
+    payload['data'] = data
+    return json_response(payload)
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@bp.route('/api/stream')
+def api_stream():
+    """推送接口（Server-Sent Events）：连接时发送当前统计摘要，之后每次后台同步只推送变化的应用行"""
+    hours = request.args.get('hours', 1, type=int)
+    if hours not in TIME_LABELS:
+        hours = 1
+    
+    active = parse_active(request.args)
+    window = (hours, active)
+    if not stream_slots.acquire(blocking=False):
+        return jsonify({'success': False, 'error': "推送连接数已达上限，请稍后重试"}), 503, {'Retry-After': '60'}
+    subscriber = broadcaster.subscribe(window)
+    try:
+        initial = summarize_stats(cached_stats(hours, active))
+    except Exception:
+        broadcaster.unsubscribe(window, subscriber)
+        stream_slots.release()
+        raise
+    
+    def generate():
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        yield format_sse('snapshot', initial)
+        while True:
+            try:
+                event, data = subscriber.get(timeout=STREAM_KEEPALIVE)
+            except queue.Empty:
+                # 保持连接；定时任务没有运行时由这里按需补同步，同步后会推送增量
+                yield ": keepalive\n\n"
+                ensure_store_fresh()
+                continue
+            yield format_sse(event, data)
+    
+    def close():
+        broadcaster.unsubscribe(window, subscriber)
+        stream_slots.release()
+    
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # 连接关闭时总会调用（生成器还没开始迭代就断开时 finally 不会执行）
+    response.call_on_close(close)
+    return response
+
+def endpoint_name():
+    """当前请求的视图名（去掉蓝图前缀），用作指标标签"""
+    return (request.endpoint or 'unknown').rpartition('.')[2]
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if PROFILE_REQUESTS and profile_lock.acquire(blocking=False):
+        # 同一时间只能有一个 cProfile 在运行，并发请求时其余请求不做剖析
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@bp.after_app_request
+def record_request_time(response):
+    REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint_name())
+    return response
+
+@bp.teardown_app_request
+def dump_request_profile(exc):
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    try:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{endpoint_name()}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+    finally:
+        profile_lock.release()
+
+@bp.route('/metrics')
+def metrics():
+    """Prometheus 格式的运行指标：各阶段耗时、每请求事件数、缓存命中率、上游错误数"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/debug/time')
 def debug_time():
     """调试时间信息"""
-    from datetime import timezone
-    
     now_local = datetime.now()
     now_utc = datetime.now(timezone.utc)
     
@@ -457,21 +1009,40 @@ def debug_time():
     
     return jsonify(debug_info)
 
-@app.route('/debug/events')
+@bp.route('/debug/scheduler')
+def debug_scheduler():
+    """同步调度状态：本进程的角色，以及（负责同步时）各数据源当前的同步间隔和距下次同步的秒数"""
+    return jsonify({
+        'role': ingest_state['role'],
+        'running': ingest_scheduler.running,
+        'sources': ingest_scheduler.status() if ingest_scheduler.running else {},
+    })
+
+def fetch_sample_events(source, n):
+    """流式读取 bucket 中最新的 n 个事件，读够后立即关闭连接，不下载完整历史"""
+    events = source.client.iter_json(f"/buckets/{source.bucket}/events", params={'limit': n})
+    with contextlib.closing(events):
+        return list(itertools.islice(events, n))
+
+def fetch_bucket_event_count(source):
+    """获取 bucket 中的事件总数（ActivityWatch 的 events/count 接口），获取失败时返回 None"""
+    try:
+        return source.client.get_json(f"/buckets/{source.bucket}/events/count")
+    except ActivityWatchUnavailable:
+        return None
+
+@bp.route('/debug/events')
 def debug_events():
     """调试事件数据格式"""
-    url = f"{BASE_URL}/buckets/{BUCKET_ID}/events"
-    
     try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        all_events = resp.json()
+        source = get_source(request.args.get('source'))
         
-        # 分析前几个事件的时间戳格式
-        sample_events = all_events[:5] if all_events else []
+        # 分析前几个事件的时间戳格式，只流式读取需要的几个事件
+        sample_events = fetch_sample_events(source, 5)
         
         debug_info = {
-            'total_events': len(all_events),
+            'source': source.name,
+            'total_events': fetch_bucket_event_count(source),
             'sample_events': []
         }
         
@@ -487,13 +1058,12 @@ def debug_events():
             # 尝试解析时间戳
             timestamp_str = event.get('timestamp')
             if timestamp_str:
-                try:
-                    from dateutil import parser
-                    parsed_time = parser.parse(timestamp_str)
+                parsed_time = timestamps.parse(timestamp_str)
+                if parsed_time is None:
+                    event_info['parse_error'] = f"无法解析的时间戳: {timestamp_str!r}"
+                else:
                     event_info['parsed_timestamp'] = parsed_time.isoformat()
-                    event_info['parsed_timezone'] = str(parsed_time.tzinfo)
-                except Exception as e:
-                    event_info['parse_error'] = str(e)
+                    event_info['local_time'] = timestamps.to_local(parsed_time.timestamp()).isoformat()
             
             debug_info['sample_events'].append(event_info)
         
@@ -502,18 +1072,14 @@ def debug_events():
     except Exception as e:
         return jsonify({'error': str(e)})
 
-@app.route('/debug/durations')
+@bp.route('/debug/durations')
 def debug_durations():
     """调试事件持续时间格式"""
-    url = f"{BASE_URL}/buckets/{BUCKET_ID}/events"
-    
     try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        all_events = resp.json()
+        source = get_source(request.args.get('source'))
         
         # 分析前几个事件的持续时间
-        sample_events = all_events[:10] if all_events else []
+        sample_events = fetch_sample_events(source, 10)
         
         durations = []
         total_sample_duration = 0
@@ -529,14 +1095,16 @@ def debug_durations():
             total_sample_duration += duration
         
         debug_info = {
-            'total_events': len(all_events),
+            'source': source.name,
+            'total_events': fetch_bucket_event_count(source),
+            'stored_unit': event_store.duration_unit(source.key),
             'sample_durations': durations,
             'total_sample_duration': total_sample_duration,
             'avg_duration': total_sample_duration / len(sample_events) if sample_events else 0,
             'duration_analysis': {
                 'min_duration': min([d['duration'] for d in durations]) if durations else 0,
                 'max_duration': max([d['duration'] for d in durations]) if durations else 0,
-                'estimated_unit': 'seconds' if total_sample_duration < 1000 else 'milliseconds' if total_sample_duration < 1000000 else 'microseconds'
+                'estimated_unit': detect_duration_unit(sample_events)
             }
         }
         
@@ -545,39 +1113,88 @@ def debug_durations():
     except Exception as e:
         return jsonify({'error': str(e)})
 
-def fetch_recent_window_events_api():
-    """为API调用获取窗口事件数据（不打印日志）- 保持向后兼容"""
-    return fetch_window_events_by_timerange_smart(1)
-
 # 启动定时任务和Web服务
+ingest_scheduler = IngestScheduler(
+    SOURCES,
+    ingest_source,
+    on_update=after_ingest,
+    active_interval=INTERVAL,
+    idle_interval=SYNC_IDLE_INTERVAL,
+    jitter=SYNC_JITTER,
+    max_workers=min(32, len(SOURCES))
+)
+
 def start_scheduler():
-    """在后台运行定时任务"""
-    import threading
-    
-    def run_scheduler():
-        print(f"定时获取 {BUCKET_ID} 最近1小时窗口使用记录，每{INTERVAL}秒一次。")
-        print("如果 ActivityWatch 服务未运行，将自动忽略错误。")
-        while True:
-            schedule.run_pending()
-            time.sleep(1)
-    
-    scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-    scheduler_thread.start()
+    """启动后台同步调度器"""
+    print(f"增量同步 {len(SOURCES)} 个数据源的窗口使用记录到 {EVENT_DB_PATH}，"
+          f"有活动时每{INTERVAL}秒一次，空闲时逐步放宽到每{SYNC_IDLE_INTERVAL}秒一次。")
+    print("如果 ActivityWatch 服务未运行，将自动忽略错误。")
+    ingest_scheduler.start()
+
+def start_ingest(mode=INGEST_MODE):
+    """决定本进程的同步角色：抢到选主锁的进程启动调度器，其余进程只读并跟随数据库的变化"""
+    if ingest_state['role'] is not None:
+        return ingest_state['role']
+    if mode == 'auto' and leader_lock.try_acquire():
+        become_leader()
+    else:
+        ingest_state['role'] = 'follower'
+        load_sync_status()
+        threading.Thread(target=follow_store, args=(mode,), name='aw-follow', daemon=True).start()
+    return ingest_state['role']
+
+def become_leader():
+    ingest_state['role'] = 'leader'
+    print(f"[{datetime.now()}] 进程 {os.getpid()} 负责同步 ActivityWatch 数据")
+    load_sync_status()
+    start_scheduler()
+
+def follow_store(mode):
+    """只读进程的后台线程：数据库有新写入时刷新同步状态、推送统计；同步进程退出后由某个只读进程接手"""
+    version = event_store.version
+    while True:
+        time.sleep(FOLLOW_INTERVAL)
+        if mode == 'auto' and leader_lock.try_acquire():
+            become_leader()
+            return
+        current = event_store.version
+        if current == version:
+            continue
+        version = current
+        try:
+            load_sync_status()
+            refresh_timelines()
+            publish_stats_updates()
+        except Exception as e:
+            print(f"[{datetime.now()}] 读取同步结果出错: {e}")
+
+def create_app(ingest=None):
+    """应用工厂：创建 Flask 应用并确定本进程的同步角色
+
+    ingest 为 'auto'（默认，取 AW_INGEST）时多个进程中只有一个负责同步，'off' 时本进程只读。
+    生产环境用 gunicorn 启动多个工作进程：gunicorn -c gunicorn.conf.py wsgi:app
+    """
+    app = Flask(__name__)
+    app.config['JSON_AS_ASCII'] = False  # 支持中文显示
+    app.register_blueprint(bp)
+    start_ingest(ingest or INGEST_MODE)
+    return app
 
 if __name__ == '__main__':
-    # 安排定时任务
-    schedule.every(INTERVAL).seconds.do(fetch_recent_window_events)
+    app = create_app()
     
-    # 启动后台定时任务
-    start_scheduler()
+    # 本进程负责同步时先同步一次，页面打开就有数据
+    if ingest_state['role'] == 'leader':
+        sync_event_store()
     
-    # 启动Flask Web服务
+    # 启动Flask Web服务（开发用；生产环境请用 gunicorn -c gunicorn.conf.py wsgi:app）
     print("🚀 启动Web服务器...")
     print("📊 访问 http://localhost:5000 查看使用统计")
-    print("🔗 API接口 (支持 ?hours=1|6|24|72|168 参数):")
-    print("   - http://localhost:5000/api/events (原始事件数据)")
+    print("🔗 API接口 (支持 ?hours=N 或 ?start=...&end=... 参数):")
+    print("   - http://localhost:5000/api/events (原始事件数据，按页返回，支持 limit/cursor 和 format=ndjson)")
     print("   - http://localhost:5000/api/stats (统计数据)")
+    print("   - http://localhost:5000/api/timeline (专注时段、切换次数和按区间的时间线)")
     print("⏰ 时间筛选: 1小时/6小时/1天/3天/7天")
     print("🔌 如果 ActivityWatch 未运行，错误将被自动忽略")
     
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
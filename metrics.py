@@ -0,0 +1,172 @@
+import threading
+import time
+
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """只增不减的计数器，可带标签"""
+
+    type = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """直方图：按桶统计观测值分布，同时记录总和与次数"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._values = {}  # 标签 -> [各桶计数, 总和, 次数]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            item = self._values.get(key)
+            if item is None:
+                item = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    item[0][i] += 1
+                    break
+            item[1] += value
+            item[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 块的耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            items = sorted(self._values.items())
+            for key, (counts, total, count) in items:
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    result.append((f"{self.name}_bucket", key + (('le', _format_value(bound)),), cumulative))
+                result.append((f"{self.name}_sum", key, total))
+                result.append((f"{self.name}_count", key, count))
+        return result
+
+
+class Gauge:
+    """在采集时调用函数读取当前值的指标，函数返回数值或 {标签元组: 数值}
+
+    读取其他组件自带的计数（例如缓存命中数）时可以把 metric_type 设为 'counter'。
+    """
+
+    def __init__(self, name, documentation, function, metric_type='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.type = metric_type
+
+    def samples(self):
+        value = self.function()
+        if isinstance(value, dict):
+            return [(self.name, key, item) for key, item in sorted(value.items())]
+        return [(self.name, (), value)]
+
+
+def time_iter(histogram, iterable, **labels):
+    """包装一个迭代器，累计产出各元素所花的时间（不含消费方处理的时间），迭代结束或关闭时记录一次"""
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        histogram.observe(elapsed, **labels)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """以 Prometheus 文本格式（0.0.4）输出所有指标"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    'aw_finder_phase_seconds',
+    '各处理阶段耗时：fetch（上游网络）、decode（JSON 解析）、filter（时间范围筛选）、aggregate（统计聚合）、render（HTML 渲染）'
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'aw_finder_http_request_seconds', '各接口处理请求的耗时'
+))
+EVENTS_PER_REQUEST = REGISTRY.register(Histogram(
+    'aw_finder_events_per_request', '每个请求处理的事件数',
+    buckets=(10, 100, 1000, 10000, 100000, 1000000)
+))
+UPSTREAM_REQUESTS = REGISTRY.register(Counter(
+    'aw_finder_upstream_requests_total', '发往 ActivityWatch 的请求数'
+))
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    'aw_finder_upstream_errors_total', 'ActivityWatch 请求错误数，按错误类型区分'
+))
@@ -0,0 +1,117 @@
+import queue
+import threading
+
+
+EMPTY_SUMMARY = {'summary': None, 'apps': {}, 'categories': {}}
+
+
+def summarize_stats(stats):
+    """把统计结果压缩为推送用的摘要：概览数字、每个应用和每个分类的一行数据（不含标题列表）"""
+    app_usage = stats.get('app_usage', {}) if stats else {}
+    category_usage = stats.get('category_usage', {}) if stats else {}
+    return {
+        'summary': {
+            'total_events': stats.get('total_events', 0) if stats else 0,
+            'total_duration': stats.get('total_duration', 0) if stats else 0,
+            'app_count': len(app_usage),
+        },
+        'apps': {
+            app_name: {
+                'total_duration': data['total_duration'],
+                'percentage': data['percentage'],
+                'count': data['count'],
+                'title_count': data['title_count'],
+            }
+            for app_name, data in app_usage.items()
+        },
+        'categories': {
+            category: {
+                'total_duration': data['total_duration'],
+                'percentage': data['percentage'],
+                'count': data['count'],
+            }
+            for category, data in category_usage.items()
+        },
+    }
+
+
+def _diff_rows(old, new):
+    changed = {name: row for name, row in new.items() if old.get(name) != row}
+    removed = [name for name in old if name not in new]
+    return changed, removed
+
+
+def diff_summaries(old, new):
+    """比较两次摘要，只保留变化的应用行、分类行和被移除的应用、分类；没有变化时返回 None"""
+    changed, removed = _diff_rows(old['apps'], new['apps'])
+    changed_categories, removed_categories = _diff_rows(old['categories'], new['categories'])
+    if not changed and not removed and not changed_categories and not removed_categories \
+            and old['summary'] == new['summary']:
+        return None
+    return {
+        'summary': new['summary'],
+        'apps': changed,
+        'removed': removed,
+        'categories': changed_categories,
+        'removed_categories': removed_categories,
+    }
+
+
+class StatsBroadcaster:
+    """统计推送：后台同步后按时间窗口计算增量，推送给订阅了该窗口的页面（SSE）
+
+    每个订阅者一个有界队列；消费太慢导致队列写满时清空它的队列并改为发送完整快照。
+    """
+
+    def __init__(self, max_queue=50):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = {}  # 时间窗口 -> 订阅者队列集合
+        self._snapshots = {}  # 时间窗口 -> 最近一次推送的摘要
+
+    def subscribe(self, window):
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(window, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, window, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(window)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[window]
+                self._snapshots.pop(window, None)
+
+    def windows(self):
+        """当前有订阅者的时间窗口"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, window, stats):
+        """用最新统计和上次推送的摘要比较，把增量发给该窗口的所有订阅者"""
+        summary = summarize_stats(stats)
+        with self._lock:
+            previous = self._snapshots.get(window)
+            self._snapshots[window] = summary
+            subscribers = list(self._subscribers.get(window, ()))
+
+        delta = diff_summaries(previous or EMPTY_SUMMARY, summary)
+        if delta is None:
+            return
+        for subscriber in subscribers:
+            self._put(subscriber, ('delta', delta), summary)
+
+    def _put(self, subscriber, message, summary):
+        try:
+            subscriber.put_nowait(message)
+        except queue.Full:
+            # 订阅者跟不上，丢弃积压的增量，改发完整快照
+            while True:
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    break
+            subscriber.put_nowait(('snapshot', summary))
@@ -0,0 +1,256 @@
+"""离线批量报表：从 ActivityWatch 导出的 bucket JSON 生成按天/按周的使用统计，不需要运行中的服务
+
+    python report.py exports/ --period week --format csv -o team.csv
+    python report.py laptop.json desktop.json --since 2026-09-01 --until 2026-10-01 --active
+
+输入是 ActivityWatch 的导出文件（{"buckets": {bucket_id: {..., "events": [...]}}}，整库导出或单个 bucket 导出均可），
+或者包含这些文件的目录。每个文件是一个分片，在进程池中并行解析：先按本地日期把事件分组，
+用与 get_window_stats 相同的列式分组求和得到每天的 (app, title, 时长, 事件数) 部分结果；
+主进程把各分片的部分结果按报表周期合并后，再用 get_window_stats_from_totals 生成与 /api/stats 同样格式的统计。
+"""
+import argparse
+import bisect
+import csv
+import json
+import os
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+from dotenv import load_dotenv
+from rich import print
+
+import timestamps
+
+from afk import active_totals, merge_intervals
+from categories import load_category_rules
+from columnar import EventBatch
+from stats import DURATION_UNIT_SCALES, detect_duration_unit, event_intervals, get_window_stats_from_totals
+
+
+def find_export_files(paths):
+    """展开输入路径：目录下的所有 .json 文件（按文件名排序）和直接给出的文件"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.json')
+            ))
+        else:
+            files.append(path)
+    return files
+
+
+def load_export(path):
+    """读取导出文件，返回 {bucket_id: bucket}；也接受只有事件列表的文件（bucket id 取文件名）"""
+    with open(path, encoding='utf-8') as f:
+        raw = json.load(f)
+    if isinstance(raw, list):
+        bucket_id = os.path.splitext(os.path.basename(path))[0]
+        return {bucket_id: {'id': bucket_id, 'type': 'currentwindow', 'events': raw}}
+    return raw.get('buckets', raw)
+
+
+def local_day(ts, cache):
+    """epoch 秒对应的本地日期，按小时缓存（时区偏移只在整点附近变化）"""
+    hour = int(ts // 3600)
+    day = cache.get(hour)
+    if day is None:
+        day = cache[hour] = timestamps.to_local(ts).date()
+    return day
+
+
+def day_bounds(day):
+    """本地日期的 [开始, 结束) epoch 秒"""
+    start = datetime.combine(day, datetime.min.time()).astimezone()
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time()).astimezone()
+    return start.timestamp(), end.timestamp()
+
+
+def bucket_unit(bucket, events):
+    """时长单位：ActivityWatch 官方 watcher 以秒为单位，其他客户端按样本推断"""
+    if str(bucket.get('client', '')).startswith('aw-'):
+        return 'seconds'
+    return detect_duration_unit(events)
+
+
+def daily_totals(events, scale, since, until):
+    """按事件开始时间的本地日期分组，返回 {日期: [(app, title, 时长秒, 事件数), ...]}"""
+    batches = {}
+    day_cache = {}
+    for event in events:
+        ts = timestamps.to_epoch(event.get('timestamp'))
+        if ts is None:
+            continue
+        day = local_day(ts, day_cache)
+        if (since and day < since) or (until and day >= until):
+            continue
+        batch = batches.get(day)
+        if batch is None:
+            batch = batches[day] = EventBatch()
+        data = event.get('data', {})
+        batch.append(round(ts * 1000000), (event.get('duration', 0) or 0) * scale,
+                     data.get('app', 'Unknown'), data.get('title', 'Unknown'))
+    return {day: batch.app_title_totals() for day, batch in batches.items()}
+
+
+def daily_active_totals(events, afk_events, scale, since, until):
+    """只统计 afk bucket 中 not-afk 的时间，时长截取到每个本地日期内，返回格式同 daily_totals"""
+    if scale != 1:
+        events = [dict(event, duration=(event.get('duration', 0) or 0) * scale) for event in events]
+    window_events, lo, hi = event_intervals(events)
+    if not window_events:
+        return {}
+    afk_intervals, _, afk_until = event_intervals(afk_events, key='status')
+    # afk 数据之后（afk watcher 停止或导出时间不一致）的窗口时间无法判断是否离开电脑，按未排除计入
+    active = merge_intervals(
+        [(start, end) for start, end, status, _ in afk_intervals if status == 'not-afk'] + [(afk_until, max(hi, afk_until))]
+    )
+    starts = [interval[0] for interval in window_events]
+    longest = max(end - start for start, end, _, _ in window_events)
+
+    totals = {}
+    day_cache = {}
+    day = local_day(lo, day_cache)
+    last_day = local_day(hi, day_cache)
+    while day <= last_day:
+        if (not since or day >= since) and (not until or day < until):
+            day_start, day_end = day_bounds(day)
+            # 开始时间早于 当天开始 - 最长事件时长 的事件不可能与这一天重叠
+            first = bisect.bisect_left(starts, day_start - longest)
+            last = bisect.bisect_left(starts, day_end)
+            rows = active_totals(window_events[first:last], active, day_start, day_end)
+            if rows:
+                totals[day] = rows
+        day += timedelta(days=1)
+    return totals
+
+
+def process_export(path, since=None, until=None, active=False):
+    """分片任务：解析一个导出文件，返回 [(数据源名, bucket id, 是否排除了离开时间, {日期: 部分结果行}), ...]"""
+    buckets = load_export(path)
+    afk_by_host = {
+        bucket.get('hostname'): bucket.get('events', [])
+        for bucket in buckets.values() if bucket.get('type') == 'afkstatus'
+    }
+
+    results = []
+    for bucket_id, bucket in buckets.items():
+        if bucket.get('type', 'currentwindow') != 'currentwindow':
+            continue
+        events = bucket.get('events', [])
+        if not events:
+            continue
+        scale = DURATION_UNIT_SCALES[bucket_unit(bucket, events)]
+        afk_events = afk_by_host.get(bucket.get('hostname')) if active else None
+        if afk_events:
+            totals = daily_active_totals(events, afk_events, scale, since, until)
+        else:
+            totals = daily_totals(events, scale, since, until)
+        results.append((bucket.get('hostname') or bucket_id, bucket_id, bool(afk_events), totals))
+    return results
+
+
+def period_key(day, period):
+    if period == 'week':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.isoformat()
+
+
+def merge_reports(shards, period, category_rules=None):
+    """把各分片每天的部分结果按报表周期合并，每个周期生成一份统计，分类规则同 Web 服务"""
+    rows = {}  # 周期 -> 合并后的 (app, title, 时长, 事件数) 行
+    sources = {}  # 周期 -> 数据源 -> 汇总
+    seen = {}
+    for path, results in shards:
+        for name, bucket_id, afk_filtered, totals in results:
+            if bucket_id in seen:
+                print(f"[{datetime.now()}] 警告: bucket {bucket_id} 同时出现在 {seen[bucket_id]} 和 {path}，会被重复统计",
+                      file=sys.stderr)
+            seen[bucket_id] = path
+            for day, day_rows in totals.items():
+                key = period_key(day, period)
+                rows.setdefault(key, []).extend(day_rows)
+                source = sources.setdefault(key, {}).setdefault(name, {
+                    'total_events': 0, 'total_duration': 0, 'afk_filtered': afk_filtered
+                })
+                for _, _, duration, count in day_rows:
+                    source['total_duration'] += duration
+                    source['total_events'] += count
+
+    reports = []
+    for key in sorted(rows):
+        stats = get_window_stats_from_totals(rows[key], 'seconds', category_rules)
+        if not stats:
+            continue
+        stats['period'] = key
+        stats['sources'] = sources[key]
+        reports.append(stats)
+    return reports
+
+
+def write_json(reports, args, f):
+    json.dump({
+        'generated': timestamps.to_iso(datetime.now().timestamp()),
+        'period': args.period,
+        'active_only': args.active,
+        'reports': reports,
+    }, f, ensure_ascii=False, indent=2)
+
+
+def write_csv(reports, args, f):
+    """每个周期的每个应用、每个分类各一行"""
+    writer = csv.writer(f)
+    writer.writerow(['period', 'kind', 'name', 'total_duration', 'percentage', 'count', 'title_count'])
+    for stats in reports:
+        for category, data in sorted(stats['category_usage'].items(), key=lambda x: x[1]['total_duration'], reverse=True):
+            writer.writerow([stats['period'], 'category', category, round(data['total_duration'], 3),
+                             data['percentage'], data['count'], ''])
+        for app, data in sorted(stats['app_usage'].items(), key=lambda x: x[1]['total_duration'], reverse=True):
+            writer.writerow([stats['period'], 'app', app, round(data['total_duration'], 3),
+                             data['percentage'], data['count'], data['title_count']])
+
+
+def parse_date(value):
+    return date.fromisoformat(value)
+
+
+def run():
+    load_dotenv()  # 与 Web 服务读取同样的 .env（分类规则）
+    parser = argparse.ArgumentParser(description="从 ActivityWatch 导出文件生成离线使用报表")
+    parser.add_argument('inputs', nargs='+', help="导出的 JSON 文件或包含它们的目录")
+    parser.add_argument('--period', choices=['day', 'week'], default='day', help="报表周期（本地日期，周从周一开始）")
+    parser.add_argument('--format', choices=['json', 'csv'], default='json')
+    parser.add_argument('-o', '--output', default='-', help="输出文件，默认标准输出")
+    parser.add_argument('--since', type=parse_date, help="只统计这一天（含）之后的事件，格式 YYYY-MM-DD")
+    parser.add_argument('--until', type=parse_date, help="只统计这一天（不含）之前的事件")
+    parser.add_argument('--active', action='store_true', help="用同一主机的 afk bucket 排除离开电脑的时间")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="并行解析的进程数")
+    args = parser.parse_args()
+
+    files = find_export_files(args.inputs)
+    if not files:
+        parser.error("没有找到导出文件")
+
+    start = datetime.now()
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(files)))) as executor:
+        futures = [
+            executor.submit(process_export, path, args.since, args.until, args.active) for path in files
+        ]
+        shards = [(path, future.result()) for path, future in zip(files, futures)]
+    reports = merge_reports(shards, args.period, load_category_rules())
+
+    writer = write_csv if args.format == 'csv' else write_json
+    if args.output == '-':
+        writer(reports, args, sys.stdout)
+    else:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            writer(reports, args, f)
+    print(f"[{datetime.now()}] {len(files)} 个导出文件，{len(reports)} 个周期，"
+          f"耗时 {(datetime.now() - start).total_seconds():.1f} 秒", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class IngestScheduler:
+    """数据源同步调度器
+
+    每个数据源独立排期，同步任务在线程池中执行：
+    - 同一数据源的同步不会重叠，上一次没结束时不会再次提交；
+    - 同时执行的任务数不超过线程池大小，到期的数据源在池满时等待下一轮（背压）；
+    - 间隔带随机抖动，避免多个数据源同时请求；
+    - 自适应间隔：任务返回 True（有新活动）时使用 active_interval，否则逐次加倍直到 idle_interval。
+    每一轮有任务完成后调用一次 on_update，把结果交给聚合/推送层。
+    """
+
+    def __init__(self, sources, job, on_update=None, active_interval=120, idle_interval=960,
+                 jitter=0.1, max_workers=8, tick=1.0):
+        self.sources = list(sources)
+        self.job = job
+        self.on_update = on_update
+        self.active_interval = active_interval
+        self.idle_interval = max(idle_interval, active_interval)
+        self.jitter = jitter
+        self.max_workers = max_workers
+        self.tick = tick
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._in_flight = set()
+        self._updated = False
+        now = time.monotonic()
+        self._intervals = {source.name: active_interval for source in self.sources}
+        # 启动时把各数据源的首次同步打散到一个抖动区间内
+        self._next_run = {
+            source.name: now + random.uniform(0, jitter * active_interval) for source in self.sources
+        }
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='aw-ingest')
+        self._thread = threading.Thread(target=self._run, name='aw-ingest-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+    def status(self):
+        """各数据源当前的同步间隔、距下次同步的秒数以及是否正在同步"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                source.name: {
+                    'interval': self._intervals[source.name],
+                    'next_run_in': max(0, round(self._next_run[source.name] - now, 1)),
+                    'in_flight': source.name in self._in_flight,
+                }
+                for source in self.sources
+            }
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            self._submit_due()
+            with self._lock:
+                updated, self._updated = self._updated, False
+            if updated and self.on_update is not None:
+                try:
+                    self.on_update()
+                except Exception as e:
+                    print(f"[{datetime.now()}] 同步结果处理出错: {e}")
+
+    def _submit_due(self):
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                source for source in self.sources
+                if source.name not in self._in_flight and self._next_run[source.name] <= now
+            ]
+            # 最早到期的优先，池满时其余的留到下一轮
+            due.sort(key=lambda source: self._next_run[source.name])
+            due = due[:max(0, self.max_workers - len(self._in_flight))]
+            for source in due:
+                self._in_flight.add(source.name)
+
+        for source in due:
+            future = self._executor.submit(self.job, source)
+            future.add_done_callback(lambda f, source=source: self._job_done(source, f))
+
+    def _job_done(self, source, future):
+        active = False
+        if not future.cancelled() and future.exception() is None:
+            active = bool(future.result())
+        elif not future.cancelled():
+            print(f"[{datetime.now()}] 数据源 {source.name}: 同步出错: {future.exception()}")
+
+        with self._lock:
+            if active:
+                interval = self.active_interval
+            else:
+                interval = min(self._intervals[source.name] * 2, self.idle_interval)
+            self._intervals[source.name] = interval
+            spread = interval * self.jitter
+            self._next_run[source.name] = time.monotonic() + interval + random.uniform(-spread, spread)
+            self._in_flight.discard(source.name)
+            self._updated = True
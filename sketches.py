@@ -0,0 +1,106 @@
+import hashlib
+import heapq
+import math
+
+
+def hash64(value):
+    """字符串的 64 位哈希，跨进程稳定（不受 PYTHONHASHSEED 影响），各工作进程对同样的数据给出同样的估计"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class SpaceSaving:
+    """Space-Saving 加权 heavy hitters：最多跟踪 capacity 个元素，近似求权重最大的前 K 个
+
+    满了以后新元素替换当前权重最小的元素，并继承它的权重作为误差上界。
+    不同元素数不超过 capacity 时结果是精确的。
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.counters = {}  # 元素 -> [权重, 误差]
+        self._heap = None  # (权重, 元素)，第一次需要替换时才建立；惰性删除：与 counters 中的权重不一致的条目已过期
+
+    def __len__(self):
+        return len(self.counters)
+
+    def update(self, item, weight=1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self.counters) < self.capacity:
+            counter = self.counters[item] = [weight, 0]
+        else:
+            if self._heap is None:
+                self._rebuild_heap()
+            minimum, evicted = self._pop_min()
+            del self.counters[evicted]
+            counter = self.counters[item] = [minimum + weight, minimum]
+        if self._heap is not None:
+            self._push(counter[0], item)
+
+    def _rebuild_heap(self):
+        self._heap = [(counter[0], key) for key, counter in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def _push(self, weight, item):
+        heapq.heappush(self._heap, (weight, item))
+        if len(self._heap) > 4 * self.capacity + 64:
+            # 过期条目太多时重建堆，堆大小保持在 O(capacity)
+            self._rebuild_heap()
+
+    def _pop_min(self):
+        while True:
+            weight, item = heapq.heappop(self._heap)
+            counter = self.counters.get(item)
+            if counter is not None and counter[0] == weight:
+                return weight, item
+
+    def top(self, k=None):
+        """按权重从大到小返回 (元素, 权重, 误差上界) 列表"""
+        items = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)
+        return [(item, weight, error) for item, (weight, error) in items[:k]]
+
+
+class HyperLogLog:
+    """HyperLogLog 基数估计：用 2^p 个寄存器近似统计不同元素数，标准误差约 1.04 / sqrt(2^p)
+
+    元素较少时先精确记录元素本身，超过寄存器数后才计算哈希转成寄存器，小窗口的计数是精确的，也不需要哈希。
+    """
+
+    def __init__(self, p=10):
+        self.p = p
+        self.m = 1 << p
+        self._values = set()  # 稀疏模式下的精确元素集合
+        self._registers = None
+
+    def add(self, value):
+        if self._registers is None:
+            self._values.add(value)
+            if len(self._values) > self.m:
+                self._to_dense()
+            return
+        self._add_hash(hash64(value))
+
+    def _add_hash(self, hashed):
+        index = hashed >> (64 - self.p)
+        rest = hashed & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def _to_dense(self):
+        values, self._values = self._values, set()
+        self._registers = bytearray(self.m)
+        for value in values:
+            self._add_hash(hash64(value))
+
+    def count(self):
+        if self._registers is None:
+            return len(self._values)
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -rank for rank in self._registers)
+        zeros = self._registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # 小范围修正：改用线性计数
+            estimate = self.m * math.log(self.m / zeros)
+        return round(estimate)
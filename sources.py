@@ -0,0 +1,71 @@
+import json
+import os
+
+from aw_client import ActivityWatchClient
+
+
+class Source:
+    """一个数据源：某台机器上 ActivityWatch 的一个 bucket"""
+
+    def __init__(self, name, base_url, bucket, client, afk_bucket=None):
+        self.name = name
+        self.base_url = base_url
+        self.bucket = bucket
+        self.client = client
+        self.afk_bucket = afk_bucket  # 同一台机器的 aw-watcher-afk bucket，用于排除离开电脑的时间
+
+    @property
+    def key(self):
+        """在本地存储中区分不同数据源的键（不同机器上的 bucket 可能同名）"""
+        return f"{self.name}/{self.bucket}"
+
+    @property
+    def afk_key(self):
+        return f"{self.name}/{self.afk_bucket}" if self.afk_bucket else None
+
+    def __repr__(self):
+        return f"Source({self.name!r}, {self.base_url!r}, {self.bucket!r})"
+
+
+def default_afk_bucket(bucket):
+    """按 ActivityWatch 的命名约定推断同一主机的 afk bucket：aw-watcher-window_主机名 -> aw-watcher-afk_主机名"""
+    prefix = 'aw-watcher-window_'
+    if bucket.startswith(prefix):
+        return 'aw-watcher-afk_' + bucket[len(prefix):]
+    return None
+
+
+def load_sources(default_base_url, default_bucket):
+    """读取数据源配置
+
+    优先使用环境变量 AW_SOURCES（JSON 字符串）或 AW_SOURCES_FILE（JSON 文件路径），格式为
+    [{"name": "laptop", "base_url": "http://host:5600/api/0", "bucket": "aw-watcher-window_laptop"}, ...]，
+    都没有配置时使用单个默认数据源。同一 base_url 的多个 bucket 共用一个客户端（连接池和熔断器）。
+    afk_bucket 默认按命名约定推断，设为 null 时不排除离开电脑的时间。
+    """
+    raw = os.getenv("AW_SOURCES")
+    if not raw and os.getenv("AW_SOURCES_FILE"):
+        with open(os.getenv("AW_SOURCES_FILE"), encoding='utf-8') as f:
+            raw = f.read()
+
+    if raw:
+        configs = json.loads(raw)
+    else:
+        configs = [{'name': 'default', 'base_url': default_base_url, 'bucket': default_bucket}]
+
+    clients = {}
+    sources = []
+    for config in configs:
+        base_url = config['base_url']
+        bucket = config['bucket']
+        name = config.get('name') or bucket
+        if base_url not in clients:
+            clients[base_url] = ActivityWatchClient(base_url)
+        afk_bucket = config['afk_bucket'] if 'afk_bucket' in config else default_afk_bucket(bucket)
+        sources.append(Source(name, base_url, bucket, clients[base_url], afk_bucket))
+
+    names = [source.name for source in sources]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"数据源名称重复: {', '.join(sorted(duplicates))}")
+    return sources
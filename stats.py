@@ -0,0 +1,124 @@
+"""窗口使用统计的纯计算部分：时长单位、事件区间和从 (app, title, 时长, 事件数) 汇总行生成统计
+
+不访问 ActivityWatch 和本地存储，Web 服务（main.py）和离线报表（report.py）共用，导入时没有副作用。
+"""
+import itertools
+import statistics
+
+import timestamps
+
+from categories import UNCATEGORIZED
+from columnar import EventBatch
+from sketches import HyperLogLog, SpaceSaving
+
+UNIT_SAMPLE_SIZE = 1000  # 推断时长单位时使用的样本事件数
+DURATION_UNIT_SCALES = {'seconds': 1, 'milliseconds': 1 / 1000, 'microseconds': 1 / 1000000}
+TOP_TITLES = 15  # 每个应用返回用时最多的标题数
+TITLE_SKETCH_SIZE = 100  # 每个应用跟踪的候选标题数，大于 TOP_TITLES 以提高前几名的准确度
+TITLE_HLL_PRECISION = 10  # 标题数估计的 HyperLogLog 精度（1024 个寄存器，误差约 3%）
+
+
+def detect_duration_unit(events):
+    """根据样本时长的中位数推断单位，events 可以是事件 dict 列表或 EventBatch
+
+    使用中位数而不是平均值，个别很长的空闲事件不会把整份报表切换成毫秒。
+    """
+    if not events:
+        return 'seconds'
+    
+    if isinstance(events, EventBatch):
+        sample = list(events.durations[:UNIT_SAMPLE_SIZE])
+    else:
+        sample = [event.get('duration', 0) or 0 for event in itertools.islice(events, UNIT_SAMPLE_SIZE)]
+    median_duration = statistics.median(sample)
+    
+    # 窗口事件的典型时长是几秒到几分钟
+    if median_duration < 1000:  # 秒
+        return 'seconds'
+    elif median_duration < 1000000:  # 毫秒
+        return 'milliseconds'
+    else:  # 微秒
+        return 'microseconds'
+
+
+def convert_duration_to_seconds(duration, unit):
+    """将持续时间转换为秒，未知单位按秒处理"""
+    return duration * DURATION_UNIT_SCALES.get(unit, 1)
+
+
+def event_intervals(events, key='app'):
+    """把事件 dict 转换为按开始时间排序的 (开始, 结束, data[key], title) 区间，并返回整体的起止时间"""
+    intervals = []
+    for event in events:
+        start = timestamps.to_epoch(event.get('timestamp'))
+        if start is None:
+            continue
+        data = event.get('data', {})
+        intervals.append((start, start + (event.get('duration', 0) or 0),
+                          data.get(key, 'Unknown'), data.get('title', 'Unknown')))
+    intervals.sort(key=lambda interval: interval[0])
+    if not intervals:
+        return [], 0, 0
+    return intervals, intervals[0][0], max(interval[1] for interval in intervals)
+
+
+def get_window_stats_from_totals(rows, duration_unit, category_rules=None):
+    """根据预聚合的 (app, title, duration, count) 汇总行生成统计，结果格式与 get_window_stats 一致
+
+    同一 (app, title) 可以出现多行（例如预聚合桶和窗口边缘的原始事件、多个数据源）。
+    每个应用的标题只保留用时最多的前 TOP_TITLES 个（Space-Saving），标题总数用 HyperLogLog 估计，
+    内存和返回结果的大小不随标题数增长。每个 (app, title) 按分类规则 category_rules 归类（没有规则时都是未分类），
+    汇总到 category_usage。
+    """
+    if not rows:
+        return {}
+    
+    app_usage = {}
+    category_usage = {}
+    sketches = {}
+    total_duration = 0
+    total_events = 0
+    
+    for app_name, title, raw_duration, count in rows:
+        duration_seconds = convert_duration_to_seconds(raw_duration, duration_unit)
+        
+        if app_name not in app_usage:
+            app_usage[app_name] = {
+                'total_duration': 0,
+                'count': 0,
+            }
+            sketches[app_name] = (SpaceSaving(TITLE_SKETCH_SIZE), HyperLogLog(TITLE_HLL_PRECISION))
+        
+        app_usage[app_name]['total_duration'] += duration_seconds
+        app_usage[app_name]['count'] += count
+        top_titles, distinct_titles = sketches[app_name]
+        top_titles.update(title, duration_seconds)
+        distinct_titles.add(title)
+        category_name = category_rules.classify(app_name, title) if category_rules is not None else UNCATEGORIZED
+        category = category_usage.setdefault(category_name, {'total_duration': 0, 'count': 0})
+        category['total_duration'] += duration_seconds
+        category['count'] += count
+        total_duration += duration_seconds
+        total_events += count
+    
+    for app in app_usage:
+        top_titles, distinct_titles = sketches[app]
+        # Space-Saving 的权重是上界，duration 取 权重 - 误差 作为保证的下界，duration_error 是真实值最多再高出的秒数
+        titles = [
+            {'title': title, 'duration': duration - error, 'duration_error': error}
+            for title, duration, error in top_titles.top(TOP_TITLES)
+        ]
+        titles.sort(key=lambda item: item['duration'], reverse=True)
+        app_usage[app]['titles'] = titles
+        app_usage[app]['title_count'] = max(distinct_titles.count(), len(top_titles))
+        app_usage[app]['percentage'] = round((app_usage[app]['total_duration'] / total_duration * 100), 2) if total_duration > 0 else 0
+    for category in category_usage.values():
+        category['percentage'] = round((category['total_duration'] / total_duration * 100), 2) if total_duration > 0 else 0
+    
+    return {
+        'total_events': total_events,
+        'total_duration': total_duration,
+        'duration_unit': duration_unit,
+        'app_usage': app_usage,
+        'category_usage': category_usage
+    }
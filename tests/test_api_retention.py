@@ -0,0 +1,98 @@
+"""/api/events 和 /api/stats 跨保留期的测试：python -m unittest discover tests
+
+main 在导入时按环境变量打开本地存储，所以先指向临时目录再导入；应用以只读方式创建，不会连接 ActivityWatch。
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DIRECTORY = tempfile.mkdtemp()
+os.environ['EVENT_DB_PATH'] = os.path.join(DIRECTORY, 'events.db')
+os.environ['AW_SOURCES'] = json.dumps([
+    {'name': 'test', 'base_url': 'http://127.0.0.1:9/api/0', 'bucket': 'aw-watcher-window_test', 'afk_bucket': None}
+])
+
+import main
+import timestamps
+
+from test_event_store import BASE, DAY, make_events, raw_totals
+
+CUT = BASE + 3 * DAY
+
+
+def tearDownModule():
+    main.event_store.close()
+    shutil.rmtree(DIRECTORY, ignore_errors=True)
+
+
+class RetentionApiTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.events = make_events(5)
+        key = main.SOURCES[0].key
+        main.event_store.upsert_events(key, cls.events)
+        main.event_store.archive_days({key: BASE + 4 * DAY})
+        main.event_store.apply_retention(key, raw_before=CUT)
+        cls.client = main.create_app('off').test_client()
+
+    def expected_ids(self, start_ts, end_ts):
+        return {
+            event['id'] for event in self.events
+            if timestamps.to_epoch(event['timestamp']) + event['duration'] >= start_ts
+            and timestamps.to_epoch(event['timestamp']) <= end_ts
+        }
+
+    def test_events_clamped_to_retention(self):
+        start, end = timestamps.to_iso(BASE + DAY), timestamps.to_iso(BASE + 4 * DAY)
+        ids = []
+        cursor = None
+        while True:
+            query = {'start': start, 'end': end, 'limit': 500}
+            if cursor:
+                query['cursor'] = cursor
+            result = self.client.get('/api/events', query_string=query).get_json()
+            self.assertEqual(result['start'], timestamps.to_iso(CUT))
+            self.assertEqual(result['retained_from'], timestamps.to_iso(CUT))
+            ids.extend(event['id'] for event in result['data'])
+            cursor = result['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), self.expected_ids(CUT, BASE + 4 * DAY))
+
+        response = self.client.get('/api/events', query_string={'start': start, 'end': end, 'format': 'ndjson'})
+        self.assertEqual(response.headers['X-Retained-From'], timestamps.to_iso(CUT))
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual({json.loads(line)['id'] for line in lines}, set(ids))
+
+    def test_events_after_retention_not_flagged(self):
+        start, end = timestamps.to_iso(CUT + 3600), timestamps.to_iso(CUT + 7200)
+        result = self.client.get('/api/events', query_string={'start': start, 'end': end, 'limit': 1000}).get_json()
+        self.assertNotIn('retained_from', result)
+        self.assertEqual({event['id'] for event in result['data']}, self.expected_ids(CUT + 3600, CUT + 7200))
+
+    def test_events_entirely_before_retention(self):
+        start, end = timestamps.to_iso(BASE), timestamps.to_iso(BASE + DAY)
+        for query in ({'start': start, 'end': end}, {'start': start, 'end': end, 'format': 'ndjson'}):
+            response = self.client.get('/api/events', query_string=query)
+            self.assertEqual(response.status_code, 410)
+            self.assertEqual(response.get_json()['retained_from'], timestamps.to_iso(CUT))
+
+    def test_stats_across_retention(self):
+        for start_ts, end_ts in ((BASE + DAY + 1234, BASE + 4 * DAY + 5678), (BASE, BASE + 5 * DAY)):
+            result = self.client.get('/api/stats', query_string={
+                'start': timestamps.to_iso(start_ts), 'end': timestamps.to_iso(end_ts)
+            }).get_json()
+            expected = raw_totals(self.events, start_ts, end_ts)
+            self.assertEqual(result['data']['total_events'], sum(count for _, count in expected.values()))
+            self.assertAlmostEqual(result['data']['total_duration'],
+                                   sum(duration for duration, _ in expected.values()), places=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
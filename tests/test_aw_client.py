@@ -0,0 +1,51 @@
+"""流式 JSON 数组解析的测试：python -m unittest discover tests"""
+import json
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aw_client import iter_json_array
+
+
+def split_chunks(raw, cuts):
+    cuts = sorted(cuts)
+    return [raw[a:b] for a, b in zip([0] + cuts, cuts + [len(raw)])]
+
+
+class IterJsonArrayTest(unittest.TestCase):
+    def test_number_split_at_chunk_boundary(self):
+        self.assertEqual(list(iter_json_array([b'[1.', b'5]'])), [1.5])
+        self.assertEqual(list(iter_json_array([b'[1e', b'3]'])), [1000.0])
+        self.assertEqual(list(iter_json_array([b'[12', b'34, -', b'5]'])), [1234, -5])
+
+    def test_multibyte_character_split(self):
+        raw = json.dumps([{'title': '微信'}], ensure_ascii=False).encode('utf-8')
+        index = raw.index('信'.encode('utf-8')) + 1
+        self.assertEqual(list(iter_json_array([raw[:index], raw[index:]])), [{'title': '微信'}])
+
+    def test_random_chunk_splits(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            values = [
+                rng.choice([rng.random() * 1e6, rng.randint(-10 ** 6, 10 ** 6), 1.5e-7, True, None, 'a,b]',
+                            {'app': 'chrome.exe', 'data': [1, 2]}])
+                for _ in range(rng.randint(0, 8))
+            ]
+            raw = json.dumps(values, ensure_ascii=False).encode('utf-8')
+            cuts = rng.sample(range(len(raw) + 1), min(len(raw) + 1, rng.randint(0, 6)))
+            self.assertEqual(list(iter_json_array(split_chunks(raw, cuts))), values)
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'{"buckets": []}']))
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[1, 2']))
+        with self.assertRaises(ValueError):
+            list(iter_json_array([b'[1x]']))
+
+
+if __name__ == '__main__':
+    unittest.main()
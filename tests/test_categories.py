@@ -0,0 +1,105 @@
+"""分类规则优先级和分类推送的测试：python -m unittest discover tests"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from categories import UNCATEGORIZED, CategoryRules
+from push import EMPTY_SUMMARY, diff_summaries, summarize_stats
+from stats import get_window_stats_from_totals
+
+
+class CategoryRulesTest(unittest.TestCase):
+    def test_first_matching_rule_wins(self):
+        # contains 规则走自动机、regex 规则走合并正则，两边命中时按规则顺序取较前的一条
+        rules = CategoryRules([
+            {'category': '娱乐', 'contains': 'bilibili'},
+            {'category': '工作', 'regex': 'chrome'},
+            {'category': '学习', 'contains': 'chrome'},
+        ])
+        self.assertEqual(rules.classify('chrome.exe', 'bilibili - 视频'), '娱乐')
+        self.assertEqual(rules.classify('chrome.exe', 'GitHub'), '工作')
+        self.assertEqual(rules.classify('code.exe', 'main.py'), UNCATEGORIZED)
+
+        rules = CategoryRules([
+            {'category': '工作', 'regex': 'chrome'},
+            {'category': '娱乐', 'contains': 'bilibili'},
+        ])
+        self.assertEqual(rules.classify('chrome.exe', 'bilibili - 视频'), '工作')
+
+    def test_regex_rule_order_with_inner_groups(self):
+        # 前面的规则带内部分组时，后面规则的外层分组编号要跳过这些分组
+        rules = CategoryRules([
+            {'category': 'A', 'regex': '(foo|bar)(baz)?'},
+            {'category': 'B', 'regex': 'qux'},
+            {'category': 'C', 'regex': 'q'},
+        ])
+        self.assertEqual(rules.classify('app', 'qux'), 'B')
+        self.assertEqual(rules.classify('app', 'q'), 'C')
+        self.assertEqual(rules.classify('app', 'barbaz qux'), 'A')
+
+    def test_field(self):
+        rules = CategoryRules([
+            {'category': '应用', 'contains': 'code', 'field': 'app'},
+            {'category': '标题', 'regex': 'code', 'field': 'title'},
+            {'category': '任一', 'contains': 'vim'},
+        ])
+        self.assertEqual(rules.classify('Code.exe', 'x'), '应用')
+        self.assertEqual(rules.classify('chrome.exe', 'Code review'), '标题')
+        self.assertEqual(rules.classify('code.exe', 'code review'), '应用')
+        self.assertEqual(rules.classify('vim', 'x'), '任一')
+        self.assertEqual(rules.classify('x', 'vim'), '任一')
+        # 关键词不能跨过应用名和标题之间的分隔
+        self.assertEqual(CategoryRules([{'category': 'X', 'contains': 'ab'}]).classify('a', 'b'), UNCATEGORIZED)
+
+    def test_anchors_match_app_and_title(self):
+        rules = CategoryRules([
+            {'category': '应用', 'regex': '^code\\.exe$', 'field': 'app'},
+            {'category': '标题', 'regex': '^README', 'field': 'title'},
+        ])
+        self.assertEqual(rules.classify('Code.exe', 'x'), '应用')
+        self.assertEqual(rules.classify('my code.exe', 'x'), UNCATEGORIZED)
+        self.assertEqual(rules.classify('chrome.exe', 'README.md'), '标题')
+        self.assertEqual(rules.classify('chrome.exe', 'see README'), UNCATEGORIZED)
+
+    def test_ignore_case(self):
+        rules = CategoryRules([
+            {'category': '区分', 'contains': 'GitHub', 'ignore_case': False},
+            {'category': '不区分', 'contains': 'github'},
+        ])
+        self.assertEqual(rules.classify('chrome.exe', 'GitHub'), '区分')
+        self.assertEqual(rules.classify('chrome.exe', 'GITHUB'), '不区分')
+        rules = CategoryRules([{'category': '区分', 'regex': 'GitHub', 'ignore_case': False}])
+        self.assertEqual(rules.classify('chrome.exe', 'github'), UNCATEGORIZED)
+
+    def test_invalid_rules(self):
+        for rule in ({'contains': 'x'}, {'category': 'A'}, {'category': 'A', 'regex': '('},
+                     {'category': 'A', 'contains': 'x', 'field': 'url'}):
+            with self.assertRaises(ValueError):
+                CategoryRules([rule])
+
+
+class CategoryPushTest(unittest.TestCase):
+    def test_category_changes_are_pushed(self):
+        rules = CategoryRules([{'category': '工作', 'contains': 'code'}])
+        old = summarize_stats(get_window_stats_from_totals(
+            [('code.exe', 'a', 60, 1), ('chrome.exe', 'b', 60, 1)], 'seconds', rules))
+        new = summarize_stats(get_window_stats_from_totals(
+            [('code.exe', 'a', 120, 2), ('chrome.exe', 'b', 60, 1)], 'seconds', rules))
+        self.assertIsNone(diff_summaries(new, new))
+
+        delta = diff_summaries(old, new)
+        self.assertEqual(set(delta['categories']), {'工作', UNCATEGORIZED})
+        self.assertEqual(delta['categories']['工作']['total_duration'], 120)
+        self.assertEqual(delta['removed_categories'], [])
+
+        delta = diff_summaries(new, summarize_stats(get_window_stats_from_totals(
+            [('chrome.exe', 'b', 60, 1)], 'seconds', rules)))
+        self.assertEqual(delta['removed_categories'], ['工作'])
+
+        self.assertEqual(set(diff_summaries(EMPTY_SUMMARY, old)['categories']), {'工作', UNCATEGORIZED})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""本地存储预聚合、归档和保留期的测试：python -m unittest discover tests"""
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timestamps
+
+from archive import SegmentArchive
+from event_store import EventStore
+
+DAY = 86400
+BASE = 1760000000 // DAY * DAY  # UTC 日的开始
+
+
+def make_events(days, seed=1):
+    """生成 days 天首尾相接（偶尔有空隙、偶尔有跨天的长事件）的窗口事件，时间都是整秒"""
+    rng = random.Random(seed)
+    events = []
+    t = BASE
+    while t < BASE + days * DAY:
+        duration = rng.choice([1, 5, 30, 120, 600, 7200 if rng.random() < 0.01 else 60])
+        events.append({'id': len(events), 'timestamp': timestamps.to_iso(t), 'duration': duration,
+                       'data': {'app': rng.choice('abc'), 'title': f"t{rng.randrange(10)}"}})
+        t += duration + rng.choice([0, 0, 0, 10, 300])
+    return events
+
+
+def raw_totals(events, start_ts, end_ts):
+    """逐条汇总与 [start_ts, end_ts] 有重叠的事件，作为预聚合结果的参照"""
+    totals = {}
+    for event in events:
+        ts = timestamps.to_epoch(event['timestamp'])
+        if ts + event['duration'] >= start_ts and ts <= end_ts:
+            key = (event['data']['app'], event['data']['title'])
+            duration, count = totals.get(key, (0, 0))
+            totals[key] = (duration + event['duration'], count + 1)
+    return totals
+
+
+def grouped(rows):
+    totals = {}
+    for app, title, duration, count in rows:
+        old_duration, old_count = totals.get((app, title), (0, 0))
+        totals[(app, title)] = (old_duration + duration, old_count + count)
+    return totals
+
+
+class EventStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'events.db')
+        self.store = EventStore(path, archive=SegmentArchive(path + '.archive'))
+        self.events = make_events(5)
+        self.store.upsert_events('k', self.events)
+        rng = random.Random(2)
+        # 随机范围，外加恰好落在天边界、保留起点上的范围
+        self.ranges = [sorted(rng.uniform(BASE - 3600, BASE + 5 * DAY) for _ in range(2)) for _ in range(100)]
+        self.ranges += [(BASE, BASE + 5 * DAY), (BASE + 3 * DAY, BASE + 4 * DAY), (BASE + DAY - 1, BASE + 3 * DAY + 1)]
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def assert_totals_match_raw(self):
+        for start_ts, end_ts in self.ranges:
+            got = grouped(self.store.query_app_title_totals('k', start_ts, end_ts))
+            expected = raw_totals(self.events, start_ts, end_ts)
+            self.assertEqual(set(got), set(expected), f"范围 {start_ts}-{end_ts}")
+            for key, (duration, count) in expected.items():
+                self.assertAlmostEqual(got[key][0], duration, places=3)
+                self.assertEqual(got[key][1], count)
+
+    def assert_intervals_match_raw(self):
+        for start_ts, end_ts in self.ranges:
+            expected = []
+            for event in self.events:
+                ts = timestamps.to_epoch(event['timestamp'])
+                if ts + event['duration'] > start_ts and ts < end_ts:
+                    expected.append((ts, ts + event['duration'], event['data']['app'], event['data']['title']))
+            got = self.store.query_intervals('k', start_ts, end_ts)
+            self.assertEqual(len(got), len(expected), f"范围 {start_ts}-{end_ts}")
+            for (start, end, app, title), row in zip(expected, got):
+                self.assertAlmostEqual(row[0], start, places=5)
+                self.assertAlmostEqual(row[1], end, places=3)
+                self.assertEqual(row[2:], (app, title))
+
+    def test_rollup_matches_raw(self):
+        self.assert_totals_match_raw()
+        self.assert_intervals_match_raw()
+
+    def test_across_retention_cut(self):
+        self.assertEqual(self.store.archive_days({'k': BASE + 4 * DAY}),
+                         sum(1 for event in self.events if timestamps.to_epoch(event['timestamp']) < BASE + 4 * DAY))
+        self.store.apply_retention('k', raw_before=BASE + 3 * DAY + 3600)
+        self.assertEqual(self.store.retained_from('k'), BASE + 3 * DAY)
+        page, _ = self.store.query_events_page(['k'], BASE, BASE + 5 * DAY, len(self.events))
+        self.assertTrue(all(timestamps.to_epoch(event['timestamp']) >= BASE + 3 * DAY for _, event in page))
+        self.assert_totals_match_raw()
+        self.assert_intervals_match_raw()
+
+    def test_unarchived_days_are_kept(self):
+        self.store.archive_days({'k': BASE + 2 * DAY})
+        self.store.apply_retention('k', raw_before=BASE + 4 * DAY)
+        self.assertEqual(self.store.retained_from('k'), BASE + 2 * DAY)
+        self.assert_totals_match_raw()
+
+    def test_downsampled_rollup(self):
+        self.store.archive_days({'k': BASE + 4 * DAY})
+        self.store.apply_retention('k', raw_before=BASE + 2 * DAY, downsample_before=BASE + 3 * DAY)
+        self.assert_totals_match_raw()
+
+
+if __name__ == '__main__':
+    unittest.main()
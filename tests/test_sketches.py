@@ -0,0 +1,80 @@
+"""Space-Saving 和 HyperLogLog 的测试：python -m unittest discover tests"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sketches import HyperLogLog, SpaceSaving
+from stats import get_window_stats_from_totals
+
+
+def zipf_stream(count, distinct, seed):
+    """按 Zipf 分布抽取标题和时长，接近少数标题占大头的真实情况"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    titles = rng.choices([f"title-{i}" for i in range(distinct)], weights, k=count)
+    return [(title, rng.uniform(1, 60)) for title in titles]
+
+
+class SpaceSavingTest(unittest.TestCase):
+    def test_exact_below_capacity(self):
+        sketch = SpaceSaving(10)
+        totals = {}
+        for title, weight in zipf_stream(1000, 10, seed=1):
+            sketch.update(title, weight)
+            totals[title] = totals.get(title, 0) + weight
+        expected = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+        self.assertEqual([(item, weight, 0) for item, weight in expected], sketch.top())
+
+    def test_top_k_bounds_over_capacity(self):
+        sketch = SpaceSaving(100)
+        totals = {}
+        for title, weight in zipf_stream(20000, 2000, seed=2):
+            sketch.update(title, weight)
+            totals[title] = totals.get(title, 0) + weight
+        self.assertEqual(len(sketch), 100)
+        for item, weight, error in sketch.top():
+            # 权重是上界，权重 - 误差 是下界
+            self.assertLessEqual(totals[item], weight + 1e-6)
+            self.assertGreaterEqual(totals[item], weight - error - 1e-6)
+        # 真实的前 5 名一定被跟踪，并排在前面
+        true_top = [item for item, _ in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:5]]
+        self.assertEqual(set(true_top), {item for item, _, _ in sketch.top(5)})
+
+
+class HyperLogLogTest(unittest.TestCase):
+    def test_exact_in_sparse_mode(self):
+        sketch = HyperLogLog(10)
+        for i in range(1000):
+            sketch.add(f"title-{i % 700}")
+        self.assertEqual(sketch.count(), 700)
+
+    def test_estimate_within_error(self):
+        for distinct in (2000, 20000, 100000):
+            sketch = HyperLogLog(10)
+            for i in range(distinct):
+                sketch.add(f"title-{i}")
+            # 标准误差约 1.04 / sqrt(1024) ≈ 3.3%，取 4 倍作为允许范围
+            self.assertAlmostEqual(sketch.count() / distinct, 1, delta=4 * 1.04 / 32)
+
+
+class TitleStatsTest(unittest.TestCase):
+    def test_title_durations_are_lower_bounds(self):
+        totals = {}
+        rows = []
+        for title, weight in zipf_stream(20000, 2000, seed=3):
+            rows.append(('app', title, weight, 1))
+            totals[title] = totals.get(title, 0) + weight
+        stats = get_window_stats_from_totals(rows, 'seconds')
+        titles = stats['app_usage']['app']['titles']
+        self.assertEqual(len(titles), 15)
+        for item in titles:
+            self.assertLessEqual(item['duration'], totals[item['title']] + 1e-6)
+            self.assertLessEqual(totals[item['title']], item['duration'] + item['duration_error'] + 1e-6)
+        self.assertEqual(titles, sorted(titles, key=lambda item: item['duration'], reverse=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
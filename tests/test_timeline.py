@@ -0,0 +1,116 @@
+"""专注时段增量维护的回归测试：python -m unittest discover tests"""
+import math
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import timestamps
+
+from event_store import EventStore
+from timeline import FocusWindow, FocusSession, SessionTracker, build_sessions
+
+GAP = 60
+HOUR = 3600
+WINDOWS = [1 * HOUR, 24 * HOUR, 168 * HOUR]
+
+
+def make_events(count, end, seed=1):
+    """生成 count 个首尾相接（偶尔有空隙）的窗口事件，最后一个事件在 end 附近结束"""
+    rng = random.Random(seed)
+    specs = []
+    for i in range(count):
+        specs.append((rng.choice([5, 20, 60, 300]), rng.choice([0, 0, 10, 120]), rng.choice(['a', 'a', 'b', 'c'])))
+    t = end - sum(duration + gap for duration, gap, _ in specs)
+    events = []
+    for i, (duration, gap, app) in enumerate(specs):
+        events.append({'id': i, 'timestamp': timestamps.to_iso(t), 'duration': duration,
+                       'data': {'app': app, 'title': 'x'}})
+        t += duration + gap
+    return events
+
+
+class SessionTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = EventStore(os.path.join(self.directory.name, 'events.db'))
+        self.tracker = SessionTracker(GAP, 169 * HOUR, WINDOWS)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def update(self, now):
+        self.tracker.update(
+            lambda frontier: [
+                interval for interval in self.store.query_intervals('k', frontier, math.inf)
+                if interval[0] >= frontier
+            ],
+            now,
+            self.store.version,
+            lambda seq: self.store.changed_since('k', seq)
+        )
+
+    def assert_matches_rebuild(self, now):
+        sessions = build_sessions(self.store.query_intervals('k', 0, math.inf), GAP)
+        for seconds in WINDOWS:
+            cut = now - seconds
+            switches = sum(1 for i, session in enumerate(sessions) if i > 0 and session.start >= cut)
+            longest = max([session.clipped(cut, now) for session in sessions] + [0])
+            got = self.tracker.summary(seconds, now)
+            self.assertEqual(got[0], switches, f"窗口 {seconds} 秒的切换次数")
+            self.assertAlmostEqual(got[1], longest, places=6)
+
+    def test_older_events_written_after_update(self):
+        # 同步按时间倒序分批写入：先看到最新的一批，之后才写入更早的事件
+        now = 1760000000.0
+        events = make_events(700, now)
+        self.store.upsert_events('k', events[-100:])
+        self.update(now)
+        for start in range(500, -1, -100):
+            self.store.upsert_events('k', events[start:start + 100])
+            self.update(now)
+            self.assert_matches_rebuild(now)
+
+    def test_unchanged_overlap_does_not_rebuild(self):
+        now = 1760000000.0
+        events = make_events(200, now)
+        self.store.upsert_events('k', events)
+        self.update(now)
+        frontier = self.tracker.frontier
+        sessions = len(self.tracker.sessions)
+        # 增量同步向前重叠取回的事件没有变化，最后一个事件因心跳合并变长
+        self.store.upsert_events('k', events[-20:-1] + [dict(events[-1], duration=events[-1]['duration'] + 30)])
+        self.assertEqual(self.store.changed_since('k', self.tracker.write_seq)[0],
+                         timestamps.to_epoch(events[-1]['timestamp']))
+        self.update(now + 30)
+        self.assertEqual(self.tracker.frontier, frontier)
+        self.assertEqual(len(self.tracker.sessions), sessions)
+        self.assert_matches_rebuild(now + 30)
+
+    def test_pruned_write_log_rebuilds(self):
+        now = 1760000000.0
+        events = make_events(300, now)
+        self.store.upsert_events('k', events[-50:])
+        self.update(now)
+        self.store.upsert_events('k', events[:-50])
+        self.store.prune_write_log(math.inf)
+        self.assertEqual(self.store.changed_since('k', self.tracker.write_seq)[0], -math.inf)
+        self.update(now)
+        self.assert_matches_rebuild(now)
+
+
+class FocusWindowTest(unittest.TestCase):
+    def test_add_expires_without_summary(self):
+        window = FocusWindow(HOUR)
+        for i in range(1000):
+            window.add(FocusSession(i * 100, i * 100 + 90, 'a'), True, i * 100 + 90)
+        self.assertLessEqual(len(window._starts), HOUR // 100 + 1)
+        self.assertLessEqual(len(window._longest), HOUR // 100 + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import itertools
+import threading
+
+from collections import deque
+
+
+class FocusSession:
+    """一个专注时段：同一应用的连续事件，相邻事件之间的空隙不超过 gap 秒"""
+
+    __slots__ = ('start', 'end', 'app', 'events')
+
+    def __init__(self, start, end, app, events=1):
+        self.start = start
+        self.end = end
+        self.app = app
+        self.events = events
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def clipped(self, lo, hi):
+        """落在 [lo, hi] 内的时长"""
+        return max(0.0, min(self.end, hi) - max(self.start, lo))
+
+
+def build_sessions(intervals, gap):
+    """把按开始时间排序的 (开始, 结束, app, title) 合并成专注时段：同一应用且与上一个事件的空隙不超过 gap 时并入"""
+    sessions = []
+    for start, end, app, _ in intervals:
+        last = sessions[-1] if sessions else None
+        if last is not None and last.app == app and start - last.end <= gap:
+            if end > last.end:
+                last.end = end
+            last.events += 1
+        else:
+            sessions.append(FocusSession(start, end, app))
+    return sessions
+
+
+class FocusWindow:
+    """最近 seconds 秒内的切换次数和最长专注时段，随时段结束增量更新，查询均摊 O(1)
+
+    切换次数是窗口内开始的时段数（有前一个时段的才算切换），用按开始时间排列的队列计数，过期的从队头弹出；
+    最长时段用单调队列：按结束时间排列、时长递减，新时段加入时先弹出队尾不比它长的时段。
+    窗口起点最多只切开一个时段（队头），所以最长时段是 截取后的队头 和 队列第二个元素 中较长的一个。
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._starts = deque()
+        self._longest = deque()
+
+    def add(self, session, switched, now):
+        if switched:
+            self._starts.append(session.start)
+        while self._longest and self._longest[-1].duration <= session.duration:
+            self._longest.pop()
+        self._longest.append(session)
+        # 没有人查询时也要弹出过期的时段，队列长度不随运行时间增长
+        self._expire(now - self.seconds)
+
+    def _expire(self, cut):
+        while self._starts and self._starts[0] < cut:
+            self._starts.popleft()
+        while self._longest and self._longest[0].end <= cut:
+            self._longest.popleft()
+
+    def summary(self, now, current=None, current_switched=False):
+        """返回 (切换次数, 最长专注秒数, 最长专注的时段)；current 是尚未结束的时段，现算一次"""
+        cut = now - self.seconds
+        self._expire(cut)
+
+        switches = len(self._starts)
+        best, best_duration = None, 0.0
+        candidates = list(itertools.islice(self._longest, 2))
+        if current is not None:
+            candidates.append(current)
+            if current_switched and current.start >= cut:
+                switches += 1
+        for session in candidates:
+            duration = session.clipped(cut, now)
+            if duration > best_duration:
+                best, best_duration = session, duration
+        return switches, best_duration, best
+
+
+class SessionTracker:
+    """一个数据源的专注时段，后台同步后增量更新，不必每次从头重建
+
+    最后一个时段可能还在继续（最新事件因心跳合并变长，或者后面又来了同一应用的事件），作为“当前时段”单独保存；
+    每次更新只重新读取从当前时段开始的事件，重建出的时段中除最后一个外都已结束，加入已结束时段和各滑动窗口。
+    每次更新的开销与当前时段和新事件的数量成正比，与窗口长度无关。
+
+    同步按时间倒序分批写入，更新时可能只看到较新的一部分，之后才写入更早的事件。传入 load_changes 时，
+    每次更新先问存储上次更新以来改动过的最早事件开始时间，早于 frontier 时已结束的时段不再可靠，丢弃后从头重建。
+    """
+
+    def __init__(self, gap, horizon, windows):
+        self.gap = gap
+        self.horizon = horizon
+        self.window_seconds = list(windows)
+        self.version = None  # 上次更新时的存储数据版本
+        self.write_seq = None  # 上次更新时存储的写入记录位置
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.sessions = deque()  # 已结束的时段，按开始时间排序，只保留最近 horizon 秒
+        self.current = None
+        self.current_switched = False
+        self.frontier = None  # 下次从这个时间开始重新读取事件（当前时段的开始时间）
+        self.windows = {seconds: FocusWindow(seconds) for seconds in self.window_seconds}
+        self._trimmed = False  # 是否有更早的时段已经移出 horizon
+
+    def update(self, load_intervals, now, version=None, load_changes=None):
+        """用 load_intervals(frontier) 读取开始时间不早于 frontier 的事件（按开始时间排序）更新时段
+
+        load_changes(write_seq) 返回 (上次以来改动过的最早事件开始时间或 None, 新的 write_seq)，
+        需要在读取事件之前调用，这样两次调用之间的写入会在下次更新时再报告一次，不会漏掉。
+        """
+        with self._lock:
+            if load_changes is not None:
+                changed_from, self.write_seq = load_changes(self.write_seq)
+                if self.frontier is not None and changed_from is not None and changed_from < self.frontier:
+                    self._reset()
+            frontier = self.frontier
+            if frontier is None:
+                # 第一次多读一个 horizon：窗口内第一个时段之前的时段也要读到，才能判断它是不是一次切换
+                frontier = now - 2 * self.horizon
+            sessions = build_sessions(load_intervals(frontier), self.gap)
+            self.version = version
+            if not sessions:
+                return
+            for session in sessions[:-1]:
+                switched = bool(self.sessions) or self._trimmed
+                self.sessions.append(session)
+                for window in self.windows.values():
+                    window.add(session, switched, now)
+            self.current = sessions[-1]
+            self.current_switched = bool(self.sessions) or self._trimmed
+            self.frontier = self.current.start
+
+            cut = now - self.horizon
+            while self.sessions and self.sessions[0].end <= cut:
+                self.sessions.popleft()
+                self._trimmed = True
+
+    def summary(self, seconds, now):
+        """最近 seconds 秒（需是创建时给出的窗口之一）的 (切换次数, 最长专注秒数, 最长专注的时段)"""
+        with self._lock:
+            return self.windows[seconds].summary(now, self.current, self.current_switched)
+
+    def sessions_between(self, start_ts, end_ts):
+        """与 [start_ts, end_ts] 有重叠的时段（含当前时段），以及第一个时段之前是否还有时段"""
+        with self._lock:
+            current = self.current
+            result = [current] if current is not None and current.start <= end_ts and current.end >= start_ts else []
+            index = len(self.sessions) - 1
+            while index >= 0 and self.sessions[index].end >= start_ts:
+                if self.sessions[index].start <= end_ts:
+                    result.append(self.sessions[index])
+                index -= 1
+            result.reverse()
+            return result, index >= 0 or self._trimmed
+
+
+def interval_metrics(sources, start_ts, end_ts, width):
+    """按 width 秒一个区间统计切换次数和最长专注时段
+
+    sources 是 [(数据源名, 时段列表, 第一个时段之前是否还有时段)]，时段按开始时间排序。
+    每个时段只访问它覆盖的区间，开销与时段数加区间数成正比。返回 (区间列表, 整个范围的汇总)。
+    """
+    count = max(1, int(-(-(end_ts - start_ts) // width)))
+    intervals = [
+        {'start': start_ts + i * width, 'end': min(start_ts + (i + 1) * width, end_ts),
+         'switches': 0, 'longest_focus': 0.0, 'longest_app': None}
+        for i in range(count)
+    ]
+    total = {'switches': 0, 'longest_focus': 0.0, 'longest_app': None, 'longest_source': None}
+
+    for name, sessions, has_previous in sources:
+        for i, session in enumerate(sessions):
+            if start_ts <= session.start <= end_ts and (i > 0 or has_previous):
+                intervals[min(int((session.start - start_ts) // width), count - 1)]['switches'] += 1
+                total['switches'] += 1
+            lo = max(session.start, start_ts)
+            hi = min(session.end, end_ts)
+            if hi <= lo:
+                continue
+            if hi - lo > total['longest_focus']:
+                total.update(longest_focus=hi - lo, longest_app=session.app, longest_source=name)
+            first = int((lo - start_ts) // width)
+            last = min(int((hi - start_ts) // width), count - 1)
+            for interval in intervals[first:last + 1]:
+                duration = session.clipped(interval['start'], interval['end'])
+                if duration > interval['longest_focus']:
+                    interval['longest_focus'] = duration
+                    interval['longest_app'] = session.app
+
+    for interval in intervals:
+        hours = (interval['end'] - interval['start']) / 3600
+        interval['switch_rate'] = round(interval['switches'] / hours, 2) if hours > 0 else 0
+    return intervals, total
@@ -0,0 +1,62 @@
+import time
+
+from datetime import datetime, timezone
+
+
+def parse(value):
+    """解析 ISO 8601 时间戳，返回 UTC 的 datetime，无法解析时返回 None"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def to_epoch(value):
+    """ISO 8601 时间戳转换为 epoch 秒（浮点），无法解析时返回 None
+
+    写入本地存储和构建 EventBatch 时使用，之后的计算都基于 UTC epoch。缺少时区的时间戳按
+    ActivityWatch 的约定视为 UTC，而不是像 naive datetime 的 timestamp() 那样按本机时区解释。
+    fromisoformat 在 C 中实现，Python 3.11 起支持 Z 后缀和超过 6 位的小数秒，
+    比按日期前缀缓存再拼接秒数的纯 Python 解析更快。
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def to_epoch_us(value):
+    """ISO 8601 时间戳转换为 epoch 微秒（整数），无法解析时返回 None"""
+    ts = to_epoch(value)
+    return None if ts is None else round(ts * 1000000)
+
+
+def from_epoch(ts):
+    """epoch 秒转换为 UTC 的 datetime"""
+    return datetime.fromtimestamp(ts, timezone.utc)
+
+
+def to_iso(ts):
+    """epoch 秒转换为带时区的 UTC ISO 8601 字符串，用于 API 响应和发给 ActivityWatch 的参数"""
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def to_utc(dt):
+    """datetime 转换为 UTC；naive 的 datetime 视为本地时间"""
+    return dt.astimezone(timezone.utc)
+
+
+def to_local(ts):
+    """epoch 秒转换为本地时区的 datetime，只在显示时使用"""
+    return datetime.fromtimestamp(ts).astimezone()
+
+
+def format_local(ts=None, fmt='%Y-%m-%d %H:%M:%S'):
+    """把 epoch 秒（默认当前时间）格式化为本地时间字符串，只在显示时使用"""
+    return to_local(time.time() if ts is None else ts).strftime(fmt)
@@ -0,0 +1,12 @@
+"""生产环境入口
+
+Linux/macOS：gunicorn -c gunicorn.conf.py wsgi:app
+Windows：    waitress-serve --listen=0.0.0.0:5000 --threads=8 wsgi:app
+
+每个工作进程各自创建应用；通过数据库旁的文件锁选出一个进程负责向 ActivityWatch 同步，
+其余进程只读。也可以设置 AW_INGEST=off 并单独运行 python ingest.py 负责同步。
+每个推送连接（/api/stream）一直占用一个线程，每个进程最多 STREAM_MAX_CLIENTS 个，用 waitress 时按线程数设置。
+"""
+from main import create_app
+
+app = create_app()